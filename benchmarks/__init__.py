@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+# benchmarks import the pipeline modules from src (not a package)
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parents[1] / 'src'))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import acquire
+import download_cache
+
+'''
+
+Acquisition of the sources (see acquire.py) from a local server that answers
+every request after `latency` seconds, one after another (1 worker) vs. from
+the thread pool. The cache revalidates every time (ttl 0, no validators), so
+every source is transferred again, as after the ttl of the real sources.
+
+'''
+
+latency = 0.2
+nsources = 8 # 5 Eurostat tables, the geo dictionary and 2 UNDESA workbooks of one base year
+body = b'x' * 64 * 1024
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        time.sleep(latency)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TimeAcquire:
+    params = [1, 4, 8]
+    param_names = ['workers']
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 120
+
+    def setup(self, workers):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), SlowHandler)
+        threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True).start()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = download_cache.DownloadCache(self.tmp.name, ttl=0)
+        url = 'http://127.0.0.1:' + str(self.httpd.server_port) + '/'
+        self.sources = [acquire.Source('s' + str(i), lambda url=url + str(i): self.cache.fetch(url))
+            for i in range(nsources)]
+
+    def teardown(self, workers):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.tmp.cleanup()
+
+    def time_acquire(self, workers):
+        acquire.acquire(self.sources, max_workers=workers, cache=self.cache, verbose=False)
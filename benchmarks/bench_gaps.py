@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import gaps
+import flags
+
+'''
+
+Gap computation of the Eurostat recode: the former loop adding one column per
+contrast, origin group and gender to the wide frame vs. the broadcast engine
+in gaps.py, on the frame (as in pipeline.recode_indicator) and on one array
+(indicator, country, year, c_birth, sex) holding all indicators. Flags: the
+former strings (concatenated, reliability by a row-wise apply) vs. bitmasks
+(see flags.py).
+
+'''
+
+indicators = ['lfp', 'unemp', 'pt', 'temp']
+c_birth = ['NAT', 'FOR', 'EU28_FOR', 'NEU28_FOR']
+cblist = ['FOR', 'EU28_FOR', 'NEU28_FOR']
+
+
+def wide_frame(vname, ncountries, nyears=25):
+    # one indicator as in the recode before the gaps are added
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_product([['C' + str(i) for i in range(ncountries)],
+        [str(y) for y in range(1995, 1995 + nyears)]], names=['country', 'year'])
+    cells = pd.MultiIndex.from_product([c_birth, ['F', 'M']])
+    n = len(index) * len(cells)
+    value = pd.DataFrame(rng.uniform(5, 90, n).reshape(len(index), -1), index=index, columns=cells)
+    flag = pd.DataFrame(rng.choice(['', 'u', 'b'], n).reshape(len(index), -1), index=index, columns=cells)
+    df = pd.concat({'value': value, 'flag': flag}, axis=1)
+    df = pd.concat({'avg': df}, axis=1)
+    df = pd.concat({vname: df}, axis=1)
+    df.columns.names = ['var', 'measure', 'info', 'c_birth', 'sex']
+    return df
+
+
+def gaps_loop(df, vname):
+    # calculate gaps and add as constant per gender, add flags (former recode)
+    for cb in cblist:
+        for g in ['F', 'M']:
+            df[vname, 'iwnw', 'value', cb, g] = (
+                df.loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - df.loc[:, (vname, 'avg', 'value', 'NAT', 'F')]
+                )
+            df[vname, 'iwnw', 'flag', cb, g] = (
+                df.loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + df.loc[:, (vname, 'avg', 'flag', 'NAT', 'F')]
+                )
+            df[vname, 'iwim', 'value', cb, g] = (
+                df.loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - df.loc[:, (vname, 'avg', 'value', cb, 'M')]
+                )
+            df[vname, 'iwim', 'flag', cb, g] = (
+                df.loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + df.loc[:, (vname, 'avg', 'flag', cb, 'M')]
+                )
+            df[vname, 'iwnm', 'value', cb, g] = (
+                df.loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - df.loc[:, (vname, 'avg', 'value', 'NAT', 'M')]
+                )
+            df[vname, 'iwnm', 'flag', cb, g] = (
+                df.loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + df.loc[:, (vname, 'avg', 'flag', 'NAT', 'M')]
+                )
+    return df
+
+
+def gaps_frame(df, vname):
+    # same as pipeline.recode_indicator
+    cells = pd.MultiIndex.from_product([c_birth, ['F', 'M']])
+    shape = (len(df), len(c_birth), 2)
+    value = df[vname, 'avg', 'value'].loc[:, cells].to_numpy(dtype=float).reshape(shape)
+    flag = df[vname, 'avg', 'flag'].loc[:, cells].to_numpy(dtype=flags.dtype).reshape(shape)
+    gap, gap_flag = gaps.gaps(value, c_birth, ['F', 'M'], cblist, flags=flag)
+    blocks = [df]
+    for info, arr in [('value', gap), ('flag', gap_flag)]:
+        cols = pd.MultiIndex.from_product([[vname], list(gaps.contrasts), [info], cblist, ['F', 'M']],
+            names=df.columns.names)
+        blocks.append(pd.DataFrame(arr.reshape(len(df), -1), index=df.index, columns=cols))
+    return pd.concat(blocks, axis=1)
+
+
+class TimeGaps:
+    params = [30, 300]
+    param_names = ['countries']
+
+    def setup(self, n):
+        self.frames = {v: wide_frame(v, n) for v in indicators}
+        self.encoded = {v: flags.encode_frame(self.frames[v]) for v in indicators}
+        # (indicator, country, year, c_birth, sex)
+        shape = (len(indicators), n, 25, len(c_birth), 2)
+        self.values = np.stack([self.frames[v][v, 'avg', 'value'].to_numpy() for v in indicators]).reshape(shape)
+        self.flags = np.stack([self.encoded[v][v, 'avg', 'flag'].to_numpy() for v in indicators]).reshape(shape)
+
+    def time_loop(self, n):
+        for v in indicators:
+            gaps_loop(self.frames[v].copy(), v)
+
+    def time_engine_frame(self, n):
+        for v in indicators:
+            gaps_frame(self.encoded[v], v)
+
+    def time_engine_array(self, n):
+        gaps.gaps(self.values, c_birth, ['F', 'M'], cblist, flags=self.flags)
+
+    def time_engine_array_values(self, n):
+        gaps.gaps(self.values, c_birth, ['F', 'M'], cblist)
+
+
+class TimeFlags:
+    params = [30, 300]
+    param_names = ['countries']
+
+    def setup(self, n):
+        df = wide_frame('lfp', n)
+        self.strings = df['lfp', 'avg', 'flag'].stack([0, 1])
+        self.masks = flags.encode(self.strings)
+
+    def time_encode(self, n):
+        flags.encode(self.strings)
+
+    def time_reliability_apply(self, n):
+        self.strings.apply(lambda x: 'Low' if 'u' in x else 'Ok')
+
+    def time_reliability_mask(self, n):
+        np.where(flags.has(self.masks, 'u'), 'Low', 'Ok')
+
+    def mem_strings(self, n):
+        return self.strings.to_numpy()
+
+    def mem_masks(self, n):
+        return self.masks
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import tempfile
+import numpy as np
+import pandas as pd
+import dataset
+import flags
+import panel
+import pipeline
+
+'''
+
+Memory of the processed Eurostat panel: the long format of panel.py vs. the
+former wide frame (index country, year, c_birth, sex; columns var, measure,
+info; flags as strings), for more indicators and years than the five tables
+of 1995-2020 used in the figures. Tables are synthetic, in the layout of
+`es.get_data_df(table, True)`. Reading the stored panel: a pickle vs. the
+partitioned dataset (all of it, one indicator, one indicator and year).
+
+'''
+
+def raw_table(ncountries, nyears, seed=0):
+    # one table of the lfsa_*gacob type
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product([['PC'], ['NAT', 'FOR', 'EU28_FOR', 'NEU28_FOR', 'TOTAL'],
+        ['Y15-64', 'Y25-54'], ['F', 'M', 'T'], ['C' + str(i) for i in range(ncountries)]],
+        names=['unit', 'c_birth', 'age', 'sex', 'geo\\time'])
+    cols = {}
+    for y in range(2020, 2020 - nyears, -1):
+        value = rng.uniform(5, 90, len(index))
+        value[rng.random(len(index)) < 0.08] = np.nan
+        cols[str(y) + '_value'] = value
+        cols[str(y) + '_flag'] = rng.choice(['', '', '', 'u', 'b', 'bu'], len(index))
+    return pd.concat([index.to_frame(index=False), pd.DataFrame(cols)], axis=1)
+
+
+def recoded(nvars, nyears):
+    # long panel of `nvars` indicators v0, v1, ... (recoded as lfp)
+    frames = []
+    for i in range(nvars):
+        df = pipeline.recode_indicator(raw_table(36, nyears, seed=i), 'lfp')
+        df['var'] = df['var'].cat.rename_categories(['v' + str(i)])
+        frames.append(df)
+    return panel.concat(frames)
+
+
+def wide_frame(long):
+    # the former layout of data/processed/eurostat.pkl
+    df = long.copy()
+    df['flag'] = flags.decode(df['flag'])
+    for key in panel.keys:
+        df[key] = df[key].astype(str)
+    df = df.set_index(panel.keys)[['flag', 'value']].astype({'value': float})
+    df = df.unstack(['var', 'measure'])
+    df.columns = df.columns.reorder_levels([1, 2, 0])
+    df.columns.names = ['var', 'measure', 'info']
+    return df.sort_index(axis=1)
+
+
+class MemPanel:
+    params = ([5, 20], [25, 50])
+    param_names = ['indicators', 'years']
+    timeout = 300
+
+    def setup(self, nvars, nyears):
+        self.raw = raw_table(36, nyears)
+        self.long = recoded(nvars, nyears)
+        self.wide = wide_frame(self.long)
+
+    def time_recode(self, nvars, nyears):
+        pipeline.recode_indicator(self.raw, 'lfp')
+
+    def track_bytes_long(self, nvars, nyears):
+        return int(self.long.memory_usage(deep=True).sum())
+    track_bytes_long.unit = 'bytes'
+
+    def track_bytes_wide(self, nvars, nyears):
+        return int(self.wide.memory_usage(deep=True).sum())
+    track_bytes_wide.unit = 'bytes'
+
+
+class TimeRead:
+    params = [5, 20]
+    param_names = ['indicators']
+
+    def setup(self, nvars):
+        self.tmp = tempfile.TemporaryDirectory()
+        long = recoded(nvars, 25)
+        self.pkl = self.tmp.name + '/eurostat.pkl'
+        self.root = self.tmp.name + '/eurostat'
+        long.to_pickle(self.pkl)
+        pipeline.write_eurostat(long, self.root)
+
+    def teardown(self, nvars):
+        self.tmp.cleanup()
+
+    def time_pickle(self, nvars):
+        pd.read_pickle(self.pkl)
+
+    def time_dataset(self, nvars):
+        dataset.read(self.root)
+
+    def time_dataset_indicator(self, nvars):
+        dataset.read(self.root, var='v0')
+
+    def time_dataset_indicator_year(self, nvars):
+        dataset.read(self.root, var='v0', year='2019')
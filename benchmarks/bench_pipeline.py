@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import os
+import tempfile
+from pathlib import Path
+import numpy as np
+import bulk
+import countries
+import export
+import export_cache
+import gaps
+import ingest
+import pipeline
+import sources
+import stocks
+from . import synthetic
+
+'''
+
+The pipeline stage by stage on synthetic sources (see synthetic.py) at 1x,
+10x and 100x the size of the real data: UNDESA ingest, recode and migrant
+stock tensor (see stocks.py), reading the Eurostat bulk downloads (all rows
+vs. the rows used), Eurostat recode, gaps, cube and plot frames, every figure
+builder, the html chunks and the static image export. The UNDESA workbook
+only grows by countries of origin and stops at 10x (100x the real origins
+exceed the columns of an xlsx sheet).
+
+'''
+
+rawdir = str(Path(__file__).parents[1] / 'data' / 'raw') + '/'
+total_file = rawdir + 'UN_MigrantStockTotal_2019.xlsx'
+undesa_scales = [1, 10]
+lfp = sources.indicators['lfp']
+
+
+class TimeUndesa:
+    params = undesa_scales
+    param_names = ['scale']
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 300
+
+    def setup_cache(self):
+        # workbooks are written once, to the working directory of the run
+        files = {}
+        for scale in undesa_scales:
+            files[scale] = os.path.abspath('od_' + str(scale) + '.xlsx')
+            synthetic.undesa_od_workbook(files[scale], 232 * scale)
+        return files
+
+    def setup(self, files, scale):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.stored = self.tmp.name + '/stored'
+        ingest.read_workbook(files[scale], pipeline.undesa_sheets['od'], self.stored)
+        ingest.read_workbook(total_file, pipeline.undesa_sheets['total'], self.stored)
+
+    def teardown(self, files, scale):
+        self.tmp.cleanup()
+
+    def time_ingest(self, files, scale):
+        ingest.read_workbook(files[scale], pipeline.undesa_sheets['od'], self.tmp.name + '/new')
+
+    def time_ingest_stored(self, files, scale):
+        ingest.read_workbook(files[scale], pipeline.undesa_sheets['od'], self.stored)
+
+    def time_recode(self, files, scale):
+        pipeline.recode_undesa(total_file, files[scale], 2019, rawdir, self.stored)
+
+
+class TimeStocks:
+    params = undesa_scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        with tempfile.TemporaryDirectory() as tmp:
+            synthetic.undesa_od_workbook(tmp + '/od.xlsx', 232 * scale)
+            od = ingest.read_workbook(tmp + '/od.xlsx', pipeline.undesa_sheets['od'], tmp)
+        self.sheets = {s: od[s] for s in ['TOTAL', 'F', 'M']}
+        self.tensor = stocks.Stocks.from_sheets(self.sheets, pipeline.undesa_destinations)
+        self.groups = pipeline.undesa_origin_groups(self.tensor.origins)
+
+    def time_from_sheets(self, scale):
+        stocks.Stocks.from_sheets(self.sheets, pipeline.undesa_destinations)
+
+    def time_aggregate(self, scale):
+        self.tensor.aggregate(self.groups)
+
+    def time_top5(self, scale):
+        self.tensor.top(5, exclude=['Other South'])
+
+
+class TimeUndesaFigures:
+    params = undesa_scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        with tempfile.TemporaryDirectory() as tmp:
+            synthetic.undesa_od_workbook(tmp + '/od.xlsx', 232 * scale)
+            df_undesa, year = pipeline.recode_undesa(total_file, tmp + '/od.xlsx', 2019, rawdir, tmp)
+        self.df_undesa = df_undesa
+        self.frame = pipeline.undesa_plot_frame(df_undesa)
+
+    def time_plot_frame(self, scale):
+        pipeline.undesa_plot_frame(self.df_undesa)
+
+    def time_imgpop(self, scale):
+        pipeline.fig_imgpop(self.frame)
+
+    def time_imgpop_top5(self, scale):
+        pipeline.fig_imgpop_top5(self.frame)
+
+
+class TimeEurostat:
+    params = synthetic.scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        self.raw = synthetic.eurostat_table(scale)
+        self.long = pipeline.recode_indicator(self.raw, 'lfp')
+        self.dim = countries.dimension(synthetic.geo_labels(synthetic.sizes[scale][0]))
+        # average values and flags of the recode (country, year, c_birth, sex)
+        shape = synthetic.sizes[scale] + (4, 2)
+        rng = np.random.default_rng(0)
+        self.values = rng.uniform(5, 90, shape)
+        self.flags = rng.choice(np.array([0, 0, 1, 2], dtype=np.uint16), shape)
+
+    def time_recode(self, scale):
+        pipeline.recode_indicator(self.raw, 'lfp')
+
+    def time_gaps(self, scale):
+        gaps.gaps(self.values, ['EU28_FOR', 'FOR', 'NAT', 'NEU28_FOR'], ['F', 'M'],
+            ['FOR', 'EU28_FOR', 'NEU28_FOR'], flags=self.flags)
+
+    def time_cube(self, scale):
+        pipeline.eurostat_cube(self.long, self.dim)
+
+    def peakmem_recode(self, scale):
+        pipeline.recode_indicator(self.raw, 'lfp')
+
+
+class TimeBulk:
+    params = synthetic.scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup_cache(self):
+        # bulk downloads are written once, to the working directory of the run
+        files = {}
+        for scale in synthetic.scales:
+            files[scale] = os.path.abspath('eurostat_' + str(scale) + '.tsv.gz')
+            with open(files[scale], 'wb') as file:
+                file.write(synthetic.eurostat_tsv(synthetic.eurostat_table(scale)))
+        return files
+
+    def time_read_all(self, files, scale):
+        bulk.read(files[scale])
+
+    def time_read_selected(self, files, scale):
+        bulk.read(files[scale], lfp.keep, lfp.drop)
+
+    def peakmem_read_all(self, files, scale):
+        bulk.read(files[scale])
+
+    def peakmem_read_selected(self, files, scale):
+        bulk.read(files[scale], lfp.keep, lfp.drop)
+
+
+def eurostat_cube(scale):
+    long = pipeline.recode_indicator(synthetic.eurostat_table(scale), 'lfp')
+    dim = countries.dimension(synthetic.geo_labels(synthetic.sizes[scale][0]))
+    return pipeline.eurostat_cube(long, dim)
+
+
+class TimeEurostatFigures:
+    params = synthetic.scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        self.cube = eurostat_cube(scale)
+
+    def time_plot_frame(self, scale):
+        pipeline.eurostat_plot_frame(self.cube, 'lfp', measure='avg', year=2019)
+
+    def time_dd(self, scale):
+        pipeline.fig_dd(self.cube, 'lfp', 'Labor force participation', 2019)
+
+    def time_abs(self, scale):
+        pipeline.fig_abs(self.cube, 'lfp', 'Labor force participation', 2019)
+
+    def time_dd_trend(self, scale):
+        pipeline.fig_dd_trend(self.cube, 'lfp', 'Labor force participation', 2019)
+
+
+class TimeHtml:
+    params = synthetic.scales
+    param_names = ['scale']
+    timeout = 300
+
+    def setup(self, scale):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fig = pipeline.fig_dd_trend(eurostat_cube(scale), 'lfp', 'Labor force participation', 2019)
+
+    def teardown(self, scale):
+        self.tmp.cleanup()
+
+    def time_chunk(self, scale):
+        pipeline.phtml_chunk(self.fig, self.tmp.name + '/fig.html')
+
+    def time_chunk_rounded(self, scale):
+        pipeline.phtml_chunk(self.fig, self.tmp.name + '/fig.html', 3)
+
+    def track_chunk_bytes(self, scale):
+        pipeline.phtml_chunk(self.fig, self.tmp.name + '/fig.html')
+        return os.path.getsize(self.tmp.name + '/fig.html')
+    track_chunk_bytes.unit = 'bytes'
+
+    def time_chunk_lazy(self, scale):
+        pipeline.phtml_chunk(self.fig, self.tmp.name + '/fig.html', 3, self.tmp.name + '/fig.json', 'fig.json')
+
+    def track_chunk_lazy_bytes(self, scale):
+        # what the page itself loads per figure
+        pipeline.phtml_chunk(self.fig, self.tmp.name + '/fig.html', 3, self.tmp.name + '/fig.json', 'fig.json')
+        return os.path.getsize(self.tmp.name + '/fig.html')
+    track_chunk_lazy_bytes.unit = 'bytes'
+
+
+class TimeExport:
+    params = synthetic.scales
+    param_names = ['scale']
+    number = 1
+    repeat = 3
+    warmup_time = 0
+    timeout = 600
+
+    def setup(self, scale):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.fig = pipeline.fig_dd(eurostat_cube(scale), 'lfp', 'Labor force participation', 2019)
+        # start the kaleido session outside of the timing
+        queue = export.ExportQueue(workers=1)
+        queue.add(self.fig, self.tmp.name + '/fig', width=1000, height=600)
+        queue.run(verbose=False)
+        # images of the figure in the export cache
+        self.cache = export_cache.ExportCache(self.tmp.name + '/cache')
+        queue = export.ExportQueue(workers=1, cache=self.cache)
+        queue.add(self.fig, self.tmp.name + '/fig', width=1000, height=600)
+        queue.run(verbose=False)
+
+    def teardown(self, scale):
+        self.tmp.cleanup()
+
+    def time_svg_pdf(self, scale):
+        queue = export.ExportQueue(workers=1)
+        queue.add(self.fig, self.tmp.name + '/fig', width=1000, height=600)
+        queue.run(verbose=False)
+
+    def time_svg_pdf_cached(self, scale):
+        queue = export.ExportQueue(workers=1, cache=self.cache)
+        queue.add(self.fig, self.tmp.name + '/fig', width=1000, height=600)
+        queue.run(verbose=False)
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import traces
+
+'''
+
+Trace construction for the dd_trend_* figures: one boolean mask per trace over
+the whole frame vs. slices from a PartitionIndex. Frames have the shape of the
+trend plotting data (measure x reliability x origin x year per country).
+
+'''
+
+def trend_frame(ncountries, nyears=25):
+    rng = np.random.default_rng(0)
+    keys = pd.MultiIndex.from_product([
+        ['C' + str(i) for i in range(ncountries)],
+        ['iwnw', 'iwim', 'iwnm'],
+        ['For', 'EU', 'TC'],
+        range(1995, 1995 + nyears)],
+        names=['country_label', 'measure_cat', 'c_birth', 'year']).to_frame(index=False)
+    keys['reliability'] = np.where(rng.random(len(keys)) < 0.2, 'Low', 'Ok')
+    keys['value'] = rng.normal(0, 10, len(keys))
+    for col in ['country_label', 'measure_cat', 'c_birth', 'reliability']:
+        keys[col] = keys[col].astype('category')
+    return keys
+
+
+class TimeTrendTraces:
+    params = [10, 30, 100, 300]
+    param_names = ['countries']
+
+    def setup(self, n):
+        self.df = trend_frame(n)
+        self.combos = [(c, m, r, b)
+            for c in self.df['country_label'].unique()
+            for m in ['iwnw', 'iwim', 'iwnm']
+            for r in ['Ok', 'Low']
+            for b in ['For', 'EU', 'TC']]
+
+    def time_boolean_masks(self, n):
+        df = self.df
+        for c, m, r, b in self.combos:
+            df.loc[(df['reliability']==r) & (df['measure_cat']==m)
+                & (df['c_birth']==b) & (df['country_label']==c),
+                ['country_label', 'year', 'value', 'c_birth']]
+
+    def time_partition_index(self, n):
+        idx = traces.PartitionIndex(self.df, ['country_label', 'measure_cat', 'reliability', 'c_birth'],
+            columns=['country_label', 'year', 'value', 'c_birth'])
+        for c, m, r, b in self.combos:
+            idx.get(c, m, r, b)
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import gzip
+import numpy as np
+import pandas as pd
+import countries
+
+'''
+
+Synthetic sources in the layout of the fetched data, at `scale` 1, 10 or 100:
+
+- eurostat_table(): a lfsa_*gacob table as returned by
+  `es.get_data_df(table, True)` (unit, c_birth, age, sex, geo\\time and one
+  value and flag column per year), with geo_labels() for `es.get_dic('geo')`.
+  Scale 1 has the 36 geos and 26 years of the real tables, the larger ones
+  multiply the country x year cells by 10 and 100 (sizes below). Geos beyond
+  the real ones repeat their names, so the figures get more data per country.
+  eurostat_tsv() writes it as bulk download.
+- undesa_od_workbook(): the UNDESA origin/destination workbook (Tables 1-3,
+  header in row 16) with the European destinations read by the recode, for
+  `norigins` countries of origin (232 in the real workbook). The total
+  population workbook is the local copy in data/raw.
+
+'''
+
+scales = [1, 10, 100]
+
+# (countries, years) of the Eurostat tables
+sizes = {1: (36, 26), 10: (180, 52), 100: (360, 260)}
+
+aggregates = {'EA19': 'Euro area - 19 countries  (from 2015)',
+    'EU15': 'European Union - 15 countries (1995-2004)',
+    'EU27_2020': 'European Union - 27 countries (from 2020)',
+    'EU28': 'European Union - 28 countries (2013-2020)'}
+
+
+def geo_labels(ncountries):
+    # geo code -> name, the aggregates first
+    names = [c for members in countries.groups.values() for c in members]
+    labels = dict(list(aggregates.items())[:ncountries])
+    for i in range(ncountries - len(labels)):
+        labels['G' + str(i)] = names[i % len(names)]
+    return labels
+
+
+def eurostat_table(scale, seed=0):
+    ncountries, nyears = sizes[scale]
+    rng = np.random.default_rng(seed)
+    index = pd.MultiIndex.from_product([['PC'],
+        ['EU27_2020_FOR', 'EU28_FOR', 'FOR', 'NAT', 'NEU27_2020_FOR', 'NEU28_FOR', 'STLS', 'TOTAL'],
+        ['Y15-24', 'Y15-64', 'Y25-54'], ['F', 'M', 'T'], list(geo_labels(ncountries))],
+        names=['unit', 'c_birth', 'age', 'sex', 'geo\\time'])
+    cols = {}
+    for y in range(2020, 2020 - nyears, -1):
+        flag = rng.choice(['', '', '', '', 'u', 'b', 'bu', ':'], len(index))
+        value = rng.uniform(5, 90, len(index))
+        value[flag == ':'] = np.nan
+        cols[str(y) + '_value'] = value
+        cols[str(y) + '_flag'] = flag
+    return pd.concat([index.to_frame(index=False), pd.DataFrame(cols)], axis=1)
+
+
+def eurostat_tsv(df):
+    # a table of eurostat_table() as bulk download (.tsv.gz bytes)
+    dims = ['unit', 'c_birth', 'age', 'sex', 'geo\\time']
+    years = [c[:-len('_value')] for c in df.columns if c.endswith('_value')]
+    lines = [','.join(dims) + '\t' + '\t'.join(y + ' ' for y in years)]
+    keys = df[dims].astype(str).agg(','.join, axis=1)
+    cells = np.column_stack([df[y + '_value'].map('{:.1f}'.format).str.cat(df[y + '_flag'], sep=' ')
+        .where(df[y + '_flag'] != ':', ': ').to_numpy() for y in years])
+    lines += [key + '\t' + '\t'.join(row) for key, row in zip(keys, cells)]
+    return gzip.compress(('\n'.join(lines) + '\n').encode())
+
+
+# destinations kept by pipeline.recode_undesa (sort order 2019225 onwards)
+destinations = ['Austria', 'Belgium', 'Croatia', 'Czechia', 'Denmark', 'Estonia',
+    'Finland', 'France', 'Germany', 'Greece', 'Hungary', 'Iceland', 'Ireland', 'Italy',
+    'Latvia', 'Lithuania', 'Luxembourg', 'Malta', 'Montenegro', 'North Macedonia',
+    'Netherlands', 'Norway', 'Poland', 'Portugal', 'Romania', 'Serbia', 'Slovakia',
+    'Slovenia', 'Spain', 'Sweden', 'Switzerland', 'United Kingdom']
+
+
+def undesa_od_workbook(path, norigins, seed=0):
+    rng = np.random.default_rng(seed)
+    eu = ['Bulgaria', 'Cyprus']
+    origins = destinations + eu + ['Origin ' + str(i) for i in range(norigins - len(destinations) - len(eu))]
+    header = ['Year', 'Sort\norder', 'Major area', None, None, None, 'Total', 'Other North',
+        'Other South'] + origins
+    with pd.ExcelWriter(path, engine='openpyxl') as xw:
+        for t in range(1, 4):
+            rows = []
+            for k, area in enumerate(['WORLD', 'Europe'] + destinations):
+                values = rng.integers(0, 200000, len(origins)).astype(float)
+                values[rng.random(len(origins)) < 0.2] = np.nan
+                north, south = rng.integers(0, 5000, 2)
+                order = 2019223 + k if k >= 2 else 2019001 + k
+                rows.append([2019, order, area, None, 40 + k, 'B', np.nansum(values) + north + south,
+                    north, south] + list(values))
+            rows = [[None] * len(header)] * 15 + [header] + rows
+            pd.DataFrame(rows).to_excel(xw, sheet_name='Table ' + str(t), header=False, index=False)
@@ -110,9 +110,161 @@ var Img_Grid_Lightbox = new function() {
     };
 };
 
+// This script restyles plotly figures whose country buttons refer to a shared
+// data table in layout.meta.button_store instead of carrying the data (see
+// src/button_store.py). Buttons have method 'skip' and args [update, traces].
+// If the store is remote (button_store.remote: url of the figure in the data
+// server, see src/data_server.py), args are [label, traces] and the update is
+// fetched from <remote><label>.json on click (once per label).
+
+var Plotly_Button_Store = new function() {
+    // init call to register the click handler with all figures using the store
+    this.init = function() {
+        const allFigs = document.querySelectorAll('.plotly-graph-div');
+        for (let i=0; i<allFigs.length; i++) {
+            Plotly_Button_Store.register(allFigs[i]);
+        }
+    };
+    // register one (rendered) figure
+    this.register = function(gd) {
+        if (gd.layout && gd.layout.meta && gd.layout.meta.button_store && gd.on) {
+            gd.on('plotly_buttonclicked', function(e){ Plotly_Button_Store.restyle(gd, e.button); });
+        }
+    };
+    // arrays of one repeated value are stored as {fill, n}
+    this.expand = function(array) {
+        if (Array.isArray(array)) {
+            return array;
+        }
+        return new Array(array.n).fill(array.fill);
+    };
+    // update of one country from the data server (promise, kept per url)
+    let fetched = {};
+    this.fetch = function(store, label) {
+        const url = store.remote + encodeURIComponent(label) + '.json';
+        if (!(url in fetched)) {
+            fetched[url] = fetch(url).then(function(r){
+                if (!r.ok) {
+                    throw new Error(r.status);
+                }
+                return r.json();
+            });
+            // failed requests are tried again on the next click
+            fetched[url].catch(function(){ delete fetched[url]; });
+        }
+        return fetched[url];
+    };
+    this.restyle = function(gd, button) {
+        if (button.method != 'skip' || !Array.isArray(button.args) || button.args.length == 0) {
+            return;
+        }
+        const store = gd.layout.meta.button_store;
+        if (store.remote) {
+            Plotly_Button_Store.fetch(store, button.args[0]).then(function(update){
+                Plotly.restyle(gd, update, button.args[1]);
+            }).catch(function(err){ console.log('No data for ' + button.args[0] + ': ' + err); });
+            return;
+        }
+        const stored = store.updates[button.args[0]];
+        let update = {};
+        for (const attr in stored) {
+            if (stored[attr] !== null && typeof stored[attr] === 'object' && 'pool' in stored[attr]) {
+                update[attr] = stored[attr].pool.map(k => Plotly_Button_Store.expand(store.pool[k]));
+            } else {
+                update[attr] = stored[attr];
+            }
+        }
+        Plotly.restyle(gd, update, button.args[1]);
+    };
+};
+
+// This script renders lazily loaded plotly figures (see src/pipeline.py,
+// phtml_chunk): the page only has a placeholder div per figure whose data-src
+// is the url of the figure json ({data, layout, config}). A figure is fetched
+// and rendered when its placeholder comes near the viewport and purged again
+// when it is far from it, so load time and memory do not grow with the number
+// of figures. Without IntersectionObserver, all figures are rendered on load.
+
+var Plotly_Lazy = new function() {
+
+    // render within `near` of the viewport, purge beyond `far`
+    const near = '200px 0px';
+    const far = '300% 0px';
+    let rendering = new Map(); // figure -> promise of its rendering
+    let wanted = new Set(); // figures near the viewport
+    // init call to observe all placeholders
+    this.init = function() {
+        const allFigs = document.querySelectorAll('.plotly-lazy');
+        if (!('IntersectionObserver' in window)) {
+            for (let i=0; i<allFigs.length; i++) {
+                Plotly_Lazy.render(allFigs[i]);
+            }
+            return;
+        }
+        const show = new IntersectionObserver(function(entries){
+            entries.forEach(function(e){
+                if (e.isIntersecting) {
+                    Plotly_Lazy.render(e.target);
+                }
+            });
+        }, {rootMargin: near});
+        const hide = new IntersectionObserver(function(entries){
+            entries.forEach(function(e){
+                if (!e.isIntersecting) {
+                    Plotly_Lazy.purge(e.target);
+                }
+            });
+        }, {rootMargin: far});
+        for (let i=0; i<allFigs.length; i++) {
+            show.observe(allFigs[i]);
+            hide.observe(allFigs[i]);
+        }
+    };
+    this.render = function(gd) {
+        wanted.add(gd);
+        if (rendering.has(gd)) {
+            return rendering.get(gd);
+        }
+        // the json is not kept here: on the next render it comes from the browser cache
+        const done = fetch(gd.getAttribute('data-src')).then(function(r){
+            if (!r.ok) {
+                throw new Error(r.status);
+            }
+            return r.json();
+        }).then(function(fig){
+            return Plotly.newPlot(gd, fig.data, fig.layout, fig.config);
+        }).then(function(){
+            Plotly_Button_Store.register(gd);
+        }).catch(function(err){
+            // tried again when it comes into view again
+            rendering.delete(gd);
+            console.log('Figure ' + gd.getAttribute('data-src') + ' not loaded: ' + err);
+        });
+        rendering.set(gd, done);
+        return done;
+    };
+    this.purge = function(gd) {
+        wanted.delete(gd);
+        if (!rendering.has(gd)) {
+            return;
+        }
+        const done = rendering.get(gd);
+        done.then(function(){
+            // unless it came near the viewport again in the meantime
+            if (!wanted.has(gd) && rendering.get(gd) === done) {
+                rendering.delete(gd);
+                Plotly.purge(gd);
+                gd.innerHTML = '';
+            }
+        });
+    };
+};
+
 // Init on load
 window.addEventListener("load", function(){
     Img_Grid_Lightbox.init();
+    Plotly_Button_Store.init();
+    Plotly_Lazy.init();
 });
 
 // Init on DOM ready
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+
+Acquisition stage: all sources (UNDESA sheets, Eurostat tables, dictionaries)
+are requested at once from a bounded thread pool instead of one after another,
+so wall-clock time is roughly that of the slowest source instead of the sum of
+all round trips. Each source is a named loader callable with its own socket
+timeout (applied to every transfer the loader makes through the DownloadCache).
+
+Failures are kept per source: accessing a failed source in the returned
+`Acquired` mapping re-raises its exception, so the try/except fallbacks of the
+consuming code keep working as before.
+
+'''
+
+class Source:
+
+    def __init__(self, name, load, timeout=100):
+        self.name = name
+        self.load = load
+        self.timeout = timeout
+
+
+class Acquired(dict):
+    # name -> result, or the exception raised while loading; `seconds`: time
+    # taken per source
+
+    def __init__(self):
+        dict.__init__(self)
+        self.seconds = {}
+
+    def __getitem__(self, name):
+        value = dict.__getitem__(self, name)
+        if isinstance(value, BaseException):
+            raise value
+        return value
+
+    def failed(self):
+        return [n for n, v in self.items() if isinstance(v, BaseException)]
+
+
+def acquire(sources, max_workers=4, cache=None, verbose=True):
+
+    def run(source):
+        start = time.perf_counter()
+        try:
+            if cache is not None:
+                with cache.request_timeout(source.timeout):
+                    result = source.load()
+            else:
+                result = source.load()
+        except Exception as e:
+            result = e
+        return result, time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = Acquired()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [(s.name, pool.submit(run, s)) for s in sources]
+        for name, future in futures:
+            result, secs = future.result()
+            results[name] = result
+            results.seconds[name] = round(secs, 3)
+            if verbose:
+                status = 'failed (' + repr(result) + ')' if isinstance(result, BaseException) else 'ok'
+                print('Acquired ' + name + ' in ' + format(secs, '.1f') + 's: ' + status)
+    if verbose:
+        print('Acquisition finished in ' + format(time.perf_counter() - start, '.1f') + 's')
+    return results
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import ast
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+'''
+
+Incremental build graph. The pipeline is split into named stages (fetch,
+recodes, one stage per figure). Before a stage runs, its fingerprint is
+computed from
+
+- code: hashes of the source files / functions it executes (a function with
+  the top-level definitions of its file it refers to)
+- inputs: plain settings (e.g. `baseyear`, theme file hash)
+- deps: the recorded outputs of upstream stages ('stage' or 'stage:key')
+
+and compared with the build manifest. A stage is skipped if the fingerprint is
+unchanged and all files it wrote last time still exist. Stage functions return
+a JSON-serializable dict (their output, used by downstream fingerprints); the
+key 'files' lists the files written. Stages with `always=True` run every time,
+but their dependants only rerun if the output changed.
+
+Code is hashed from the source text (via ast), so checking stages never imports
+the heavy modules they use.
+
+With a `report` (instrument.Report), every stage run is measured (time,
+memory, rows, bytes written) and up-to-date stages are listed as such.
+
+Stages with `parallel=True` (e.g. recodes, figures) run once no serial stage
+is ready: all parallel stages whose dependencies are done at that point, with
+`run(workers=n)` in n forked worker processes, which inherit everything loaded
+by then. Their outputs (and files) are recorded by the parent as usual, so
+they can be needed by later stages; data a worker keeps in memory is not.
+`prepare(names)` is called with the stale ones beforehand, e.g. to load the
+data they share once in the parent.
+
+A stage that raises does not stop the build: its error is kept in `failed`,
+the stages depending on it (directly or not) are not run and listed in
+`skipped`, and all other stages run and are recorded as usual. The failed
+stages are listed at the end of run(); the caller decides how to exit.
+
+'''
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024*1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def files_hash(paths):
+    # several files, e.g. the partitions of a dataset (see dataset.py)
+    return _json_hash([file_hash(path) for path in paths])
+
+
+def _json_hash(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class Stage:
+
+    def __init__(self, name, func, deps=(), code=(), inputs=None, always=False, parallel=False):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.code = list(code)
+        self.inputs = inputs or {}
+        self.always = always
+        self.parallel = parallel
+
+
+# the build run by forked workers (set before forking, see Build.run)
+_worker_build = None
+
+def _run_worker(name):
+    start = time.perf_counter()
+    output = _worker_build._call(name)
+    record = None if _worker_build.report is None else _worker_build.report.records[name]
+    return output, time.perf_counter() - start, record
+
+
+def in_worker():
+    # True in a worker process of Build.run
+    return multiprocessing.current_process().name != 'MainProcess'
+
+
+class Build:
+
+    def __init__(self, manifest, srcdir, force=False, verbose=True, report=None):
+        self.manifest_file = Path(manifest)
+        self.srcdir = Path(srcdir)
+        self.force = force
+        self.verbose = verbose
+        self.report = report
+        self.stages = {}
+        self.failed = {} # stage -> traceback of the last run
+        self.skipped = {} # stage -> failed stage it depends on
+        self._sources = {}
+        try:
+            with open(self.manifest_file, 'r') as file:
+                self.manifest = json.load(file)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def add(self, name, func, deps=(), code=(), inputs=None, always=False, parallel=False):
+        self.stages[name] = Stage(name, func, deps, code, inputs, always, parallel)
+
+    def stage(self, name, **kwargs):
+        # decorator version of add()
+        def register(func):
+            self.add(name, func, **kwargs)
+            return func
+        return register
+
+    def output(self, name):
+        return self.manifest.get(name, {}).get('output', {})
+
+    def invalidate(self, name):
+        self.manifest.pop(name, None)
+        self._save()
+
+    ###  fingerprints  #########################################################
+
+    def _source(self, file):
+        if file not in self._sources:
+            with open(self.srcdir / file, 'r') as f:
+                text = f.read()
+            funcs, nodes = {}, {}
+            for node in ast.parse(text).body:
+                if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+                    names = [node.name]
+                elif isinstance(node, ast.Assign):
+                    names = [t.id for t in node.targets if isinstance(t, ast.Name)]
+                else:
+                    continue
+                for name in names:
+                    funcs[name] = ast.get_source_segment(text, node)
+                    nodes[name] = node
+            # top-level names of the file each definition refers to
+            refs = {name: sorted({n.id for n in ast.walk(node) if isinstance(n, ast.Name)
+                and n.id in funcs and n.id != name}) for name, node in nodes.items()}
+            self._sources[file] = (text, funcs, refs)
+        return self._sources[file]
+
+    def _closure(self, file, name):
+        # name and the top-level definitions of the file it uses, recursively
+        _, _, refs = self._source(file)
+        names, todo = set(), [name]
+        while todo:
+            n = todo.pop()
+            if n not in names:
+                names.add(n)
+                todo += refs[n]
+        return sorted(names)
+
+    def code_hash(self, items):
+        # items: 'file.py' (whole file) or 'file.py:name' (one top-level
+        # function, class or assignment, with the top-level definitions of the
+        # same file it refers to, e.g. a module-level regex; definitions in
+        # other files have to be listed)
+        h = hashlib.sha256()
+        for item in items:
+            file, _, name = item.partition(':')
+            text, funcs, _ = self._source(file)
+            h.update(item.encode())
+            if not name:
+                h.update(text.encode())
+            for n in self._closure(file, name) if name else []:
+                h.update((n + '\n' + funcs[n]).encode())
+        return h.hexdigest()
+
+    def fingerprint(self, stage):
+        deps = {}
+        for dep in stage.deps:
+            name, _, key = dep.partition(':')
+            out = self.output(name)
+            deps[dep] = out.get(key) if key else out
+        return _json_hash({
+            'code': self.code_hash(stage.code),
+            'inputs': stage.inputs,
+            'deps': deps,
+        })
+
+    ###  run  ##################################################################
+
+    def _order(self, targets):
+        # dependency-first order of the targets and everything they need
+        order = []
+        def visit(name):
+            if name in order:
+                return
+            for dep in self.stages[name].deps:
+                visit(dep.partition(':')[0])
+            order.append(name)
+        for name in targets:
+            visit(name)
+        return order
+
+    def _uptodate(self, stage, fp):
+        record = self.manifest.get(stage.name)
+        if self.force or stage.always or record is None or record['fingerprint'] != fp:
+            return False
+        return all(os.path.exists(f) for f in record['output'].get('files', []))
+
+    def run(self, targets=None, workers=1, prepare=None):
+        start = time.perf_counter()
+        targets = list(self.stages) if targets is None else targets
+        order = self._order(targets)
+        ran = []
+        self.failed, self.skipped = {}, {}
+        remaining = list(order)
+        while len(remaining) > 0:
+            # stages whose dependencies are done: the first serial one, else
+            # all parallel ones
+            ready = [name for name in remaining
+                if not any(dep.partition(':')[0] in remaining for dep in self.stages[name].deps)]
+            serial = [name for name in ready if not self.stages[name].parallel]
+            batch = serial[:1] if len(serial) > 0 else ready
+            stale = {}
+            for name in batch:
+                upstream = self._upstream_failure(name)
+                if upstream is not None:
+                    self.skipped[name] = upstream
+                    continue
+                fp = self.fingerprint(self.stages[name])
+                if self._uptodate(self.stages[name], fp):
+                    self._skipped(name)
+                else:
+                    stale[name] = fp
+            if len(serial) > 0:
+                ran += self._run_batch(stale, 1)
+            else:
+                ran += self._run_batch(stale, workers, prepare)
+            remaining = [name for name in remaining if name not in batch]
+
+        if self.verbose:
+            print('Build finished in ' + format(time.perf_counter() - start, '.2f') + 's, '
+                + str(len(ran)) + ' stage(s) run, '
+                + str(len(order) - len(ran) - len(self.failed) - len(self.skipped)) + ' up to date, '
+                + str(len(self.failed)) + ' failed, ' + str(len(self.skipped)) + ' skipped')
+            for name, error in self.failed.items():
+                print('Stage ' + name + ' failed: ' + error.strip().splitlines()[-1])
+            if len(self.skipped) > 0:
+                print('Not run (a stage they depend on failed): ' + ', '.join(self.skipped))
+        return ran
+
+    def _upstream_failure(self, name):
+        # failed stage `name` depends on (through skipped ones), else None
+        for dep in self.stages[name].deps:
+            dep = dep.partition(':')[0]
+            if dep in self.failed:
+                return dep
+            if dep in self.skipped:
+                return self.skipped[dep]
+        return None
+
+    def _run_batch(self, stale, workers, prepare=None):
+        # run the stale stages {name: fingerprint}, in forked workers if more
+        # than one and workers > 1; returns the stages that succeeded
+        if prepare is not None and len(stale) > 0:
+            prepare(list(stale))
+        done = []
+        if workers > 1 and len(stale) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+            global _worker_build
+            _worker_build = self
+            with ProcessPoolExecutor(min(workers, len(stale)), mp_context=multiprocessing.get_context('fork')) as pool:
+                futures = {pool.submit(_run_worker, name): name for name in stale}
+                for future in as_completed(futures):
+                    name = futures[future]
+                    try:
+                        output, seconds, record = future.result()
+                    except Exception: # includes the traceback of the worker
+                        self._failed(name, traceback.format_exc())
+                        continue
+                    if record is not None:
+                        self.report.add(name, record)
+                    self._record(name, stale[name], output, seconds)
+                    done.append(name)
+        else:
+            for name, fp in stale.items():
+                t = time.perf_counter()
+                try:
+                    output = self._call(name)
+                except Exception:
+                    self._failed(name, traceback.format_exc())
+                    continue
+                self._record(name, fp, output, time.perf_counter() - t)
+                done.append(name)
+        return done
+
+    def _call(self, name):
+        # run one stage (measured if there is a report)
+        if self.report is None:
+            return self.stages[name].func() or {}
+        with self.report.measure(name) as record:
+            output = self.stages[name].func() or {}
+            record['files'] = output.get('files', [])
+        return output
+
+    def _skipped(self, name):
+        if self.report is not None:
+            self.report.add(name, {'up_to_date': True})
+
+    def _failed(self, name, error):
+        # the manifest keeps the last successful run of the stage (with its
+        # former fingerprint), so it runs again next time
+        self.failed[name] = error
+        if self.report is not None:
+            self.report.records.setdefault(name, {})['error'] = error
+        if self.verbose:
+            print('Stage ' + name + ' failed:\n' + error)
+
+    def _record(self, name, fp, output, seconds):
+        self.manifest[name] = {
+            'fingerprint': fp,
+            'output': output,
+            'seconds': round(seconds, 3),
+            'updated': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        self._save()
+        if self.verbose:
+            print('Stage ' + name + ' done in ' + format(seconds, '.1f') + 's')
+
+    def _save(self):
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.manifest_file.with_suffix('.tmp')
+        with open(tmp, 'w') as file:
+            json.dump(self.manifest, file, indent=1, sort_keys=True, default=str)
+        os.replace(tmp, self.manifest_file)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import gzip
+import io
+import urllib.request
+import numpy as np
+import pandas as pd
+import flags
+
+'''
+
+Streaming reader of Eurostat bulk downloads (tab separated, gzipped), e.g.
+
+    unit,c_birth,age,sex,geo\\time<TAB>2020 <TAB>2019 ...
+    PC,FOR,Y15-64,F,AT<TAB>63.2 <TAB>61.9 b ...
+
+`es.get_data_df(code, True)` decompresses and splits the whole table before
+anything can be selected, with every age band, country of birth and
+aggregate. Here the file is decompressed and read line by line, the row
+dimensions of each line are checked against the selection first, and only
+the lines kept are split into cells, which go straight into value arrays and
+uint16 flag bitmasks (see flags.py). Time and memory scale with the rows kept,
+not with the size of the table.
+
+The frame has the layout of `es.get_data_df(code, True)`: one column per row
+dimension (categorical), then <column>_value and <column>_flag for every
+column of the table. As with the eurostat package, a cell without value
+(e.g. ': c') has value NaN and flag ':'.
+
+'''
+
+def _open(source):
+    # path, url or binary file object -> text lines of the decompressed file
+    if isinstance(source, str) and source.startswith(('http://', 'https://')):
+        source = urllib.request.urlopen(source)
+    elif not hasattr(source, 'read'):
+        source = open(source, 'rb')
+    return io.TextIOWrapper(gzip.GzipFile(fileobj=source), encoding='utf-8')
+
+
+def read(source, keep=None, drop=None):
+    '''
+    Read the bulk table `source` (path, url or binary file object), keeping
+    only the rows whose dimensions are in `keep` ({dimension: codes}) and not
+    in `drop` ({dimension: codes}), e.g.
+
+        read(path, keep={'age': ['Y15-64'], 'sex': ['F', 'M']}, drop={'geo\\time': ['EU15']})
+    '''
+    with _open(source) as lines:
+        dims, _, columns = next(lines).rstrip('\r\n').partition('\t')
+        dims = dims.split(',')
+        columns = [c.strip() for c in columns.split('\t')]
+        tests = [(dims.index(d), set(codes), True) for d, codes in (keep or {}).items()]
+        tests += [(dims.index(d), set(codes), False) for d, codes in (drop or {}).items()]
+        codes, cells = [], []
+        for line in lines:
+            key, _, rest = line.partition('\t')
+            if not rest:
+                continue
+            key = key.split(',')
+            if all((key[i] in allowed) == wanted for i, allowed, wanted in tests):
+                codes.append(key)
+                cells += rest.rstrip('\r\n').split('\t')
+
+    # value and flag of every cell ('63.2 b'), as float and bitmask
+    parts = [cell.partition(' ') for cell in cells]
+    text = np.array([p[0] for p in parts], dtype=object)
+    flag = np.array([p[2].strip() for p in parts], dtype=object)
+    value = pd.to_numeric(pd.Series(text, dtype=object), errors='coerce').to_numpy(dtype=float)
+    na = np.isnan(value)
+    flag[na] = text[na]
+    value = value.reshape(len(codes), len(columns))
+    masks = flags.encode(flag).reshape(len(codes), len(columns))
+
+    df = {}
+    codes = np.array(codes, dtype=object).reshape(len(codes), len(dims))
+    for i, dim in enumerate(dims):
+        df[dim] = pd.Categorical(codes[:, i])
+    for j, col in enumerate(columns):
+        df[col + '_value'] = value[:, j]
+        df[col + '_flag'] = masks[:, j]
+    return pd.DataFrame(df)
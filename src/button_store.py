@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import json
+import numpy as np
+from plotly.utils import PlotlyJSONEncoder
+
+'''
+
+Shared data store for figures with country selection buttons (dd_trend_*,
+imgpop_top5_*). Plotly `restyle` buttons carry full copies of the x/y/text
+arrays of every trace they update, so every country is embedded once per menu
+and repeated vectors (years, country labels) are embedded once per trace.
+
+`compact(fig)` moves the button data into a single table in `layout.meta`:
+
+    meta.button_store.pool      unique arrays; arrays of one repeated value are
+                                stored as {"fill": value, "n": length}
+    meta.button_store.updates   unique restyle updates; array attributes refer
+                                to the pool as {"pool": [index per trace]}
+
+and turns the buttons into `method: 'skip'` buttons with
+`args: [update index, trace indices]`. The restyle is done client-side by
+`Plotly_Button_Store` in docs/dep/custom.js (on `plotly_buttonclicked`).
+Buttons without array data (e.g. 'Compare to...') are left as they are.
+
+With `remote` (the url of a figure in the data server, see data_server.py),
+the data is not embedded at all: `meta.button_store.remote` holds the url and
+the buttons become `method: 'skip'` buttons with `args: [label, trace
+indices]`. custom.js fetches <remote><label>.json (the restyle update of the
+button, see updates()) when a country is selected.
+
+'''
+
+def _dumps(value):
+    return json.dumps(value, cls=PlotlyJSONEncoder)
+
+
+def _is_array(value):
+    return isinstance(value, (list, tuple, np.ndarray)) or hasattr(value, 'tolist')
+
+
+def _plain(value):
+    # json-compatible copy of a (numpy/pandas) value
+    return json.loads(_dumps(value))
+
+
+def round_floats(value, precision):
+    # round the floats of a json value to `precision` decimals (None: as is)
+    if precision is None:
+        return value
+    if isinstance(value, float):
+        return round(value, precision)
+    if isinstance(value, list):
+        return [round_floats(v, precision) for v in value]
+    if isinstance(value, dict):
+        return {k: round_floats(v, precision) for k, v in value.items()}
+    return value
+
+
+def _per_trace(button):
+    # array attributes of a restyle button (one array per trace)
+    update = (list(button.args or []) or [None])[0]
+    if button.method != 'restyle' or not isinstance(update, dict):
+        return {}
+    return {attr: val for attr, val in update.items()
+        if _is_array(val) and len(val) > 0 and all(_is_array(v) for v in val)}
+
+
+def updates(fig):
+    # restyle update by button label of the buttons with array data
+    out = {}
+    for menu in fig.layout.updatemenus:
+        for button in menu.buttons:
+            if len(_per_trace(button)) > 0 and button.label not in out:
+                out[button.label] = _plain(button.args[0])
+    return out
+
+
+def compact(fig, remote=None):
+    if remote is not None:
+        return _remote(fig, remote)
+    pool = []
+    pool_index = {}
+    updates = []
+    update_index = {}
+
+    def ref(array):
+        array = _plain(array)
+        if len(array) > 1 and all(v == array[0] for v in array[1:]):
+            array = {'fill': array[0], 'n': len(array)}
+        key = _dumps(array)
+        if key not in pool_index:
+            pool_index[key] = len(pool)
+            pool.append(array)
+        return pool_index[key]
+
+    menus = []
+    for menu in fig.layout.updatemenus:
+        buttons = []
+        for button in menu.buttons:
+            args = list(button.args or [])
+            update = args[0] if len(args) > 0 else None
+            per_trace = _per_trace(button)
+            if len(per_trace) == 0:
+                buttons.append(button)
+                continue
+            stored = {attr: ({'pool': [ref(v) for v in val]} if attr in per_trace else _plain(val))
+                for attr, val in update.items()}
+            key = _dumps(stored)
+            if key not in update_index:
+                update_index[key] = len(updates)
+                updates.append(stored)
+            traces = _plain(args[1]) if len(args) > 1 else None
+            buttons.append(button.update(method='skip',
+                args=[update_index[key]] + ([traces] if traces is not None else [])))
+        menus.append(menu.update(buttons=buttons))
+
+    if len(updates) > 0:
+        meta = fig.layout.meta if isinstance(fig.layout.meta, dict) else {}
+        meta['button_store'] = {'pool': pool, 'updates': updates}
+        fig.update_layout(updatemenus=menus, meta=meta)
+    return fig
+
+
+def _remote(fig, url):
+    menus = []
+    remote = False
+    for menu in fig.layout.updatemenus:
+        buttons = []
+        for button in menu.buttons:
+            args = list(button.args or [])
+            if len(_per_trace(button)) == 0:
+                buttons.append(button)
+                continue
+            remote = True
+            buttons.append(button.update(method='skip',
+                args=[button.label] + ([_plain(args[1])] if len(args) > 1 else [])))
+        menus.append(menu.update(buttons=buttons))
+    if remote:
+        meta = fig.layout.meta if isinstance(fig.layout.meta, dict) else {}
+        meta['button_store'] = {'remote': url}
+        fig.update_layout(updatemenus=menus, meta=meta)
+    return fig
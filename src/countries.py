@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import pandas as pd
+
+'''
+
+Country dimension shared by the UNDESA and Eurostat figures: one row per
+country as named by a source (code), with the label used in the figures, the
+destination country group and the sort order, as ordered categoricals. The
+plot frames join it with a merge on the code instead of labelling row by row.
+Countries outside the groups below get no label (and are dropped from the
+Eurostat figures).
+
+'''
+
+groups = {
+    'North-Western Europe': ['Austria', 'Belgium', 'Denmark', 'Finland', 'France',
+        'Germany', 'Iceland', 'Ireland', 'Luxembourg', 'Netherlands', 'Norway',
+        'Sweden', 'Switzerland', 'UK'],
+    'Southern Europe': ['Greece', 'Malta', 'Italy', 'Portugal', 'Spain'],
+    'Central and Eastern Europe': ['Croatia', 'Czechia', 'Estonia', 'Hungary', 'Latvia',
+        'Lithuania', 'Montenegro', 'N. Macedonia', 'Poland', 'Romania',
+        'Serbia', 'Slovakia', 'Slovenia'],
+}
+
+# source names containing the key are labelled with the value (in this order)
+renames = {
+    'Germany': 'Germany', # e.g. 'Germany (until 1990 former territory of the FRG)'
+    'European Union': 'EU28',
+    'Macedonia': 'N. Macedonia',
+    'United Kingdom': 'UK',
+}
+
+
+def label(name):
+    for key, lbl in renames.items():
+        if key in name:
+            name = lbl
+    return name
+
+
+def dimension(names):
+    '''
+    Country dimension for `names` (code -> country name as given by the
+    source, or a list of names used as codes): columns code, label, group and
+    order (position in `groups`, -1 if not in any group).
+    '''
+    if not isinstance(names, dict):
+        names = {name: name for name in names}
+    order = [c for members in groups.values() for c in members]
+    group_of = {c: g for g, members in groups.items() for c in members}
+    lbl = pd.Categorical([label(str(n)) for n in names.values()], categories=order, ordered=True)
+    dim = pd.DataFrame({'code': list(names), 'label': lbl})
+    dim['group'] = pd.Categorical(dim['label'].map(group_of), categories=list(groups), ordered=True)
+    dim['order'] = lbl.codes
+    return dim
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import flags
+
+'''
+
+Materialized cube of the Eurostat panel: values and flags as dense arrays over
+named axes
+
+    indicator x country x year x c_birth x sex x measure
+
+with an index map (label -> position) per axis. It is built once from the long
+panel (see panel.py) and the figures take what they need by label
+
+    cube.take(indicator='lfp', year=2019, sex='F', measure=['iwim', 'iwnm'])
+
+which costs a dict lookup per label and a copy of the selected cells, instead
+of a boolean mask over every row of the panel. frame() lists the cells of a
+(small) cube in axis order, so the order of the axes is the order of the rows
+the figures get.
+
+`attrs` holds labels of the positions of an axis (e.g. country label and
+group, as arrays aligned with the axis), which are sliced along and added to
+the frame. Cells that are not in the panel are marked in `present`.
+
+'''
+
+class Cube:
+
+    def __init__(self, axes, values, flags, present, attrs=None):
+        self.axes = {name: list(labels) for name, labels in axes.items()}
+        self.values = values
+        self.flags = flags
+        self.present = present
+        self.attrs = attrs or {}
+        self.index = {name: {label: i for i, label in enumerate(labels)}
+            for name, labels in self.axes.items()}
+
+    @classmethod
+    def from_panel(cls, df, axes, attrs=None):
+        '''
+        Cube of the long panel `df` (keys as in panel.keys, 'var' becomes the
+        axis 'indicator'). `axes` gives the labels and order of the axes
+        {axis: labels} (in the order of the cube), e.g. to order countries by
+        label; cells with a label not on its axis are left out. A key can be
+        relabelled, e.g. years as int, with {axis: (labels, key labels)}.
+        '''
+        keys = {'indicator': 'var'}
+        pos, shape, labels = [], [], {}
+        keep = np.ones(len(df), dtype=bool)
+        for axis, spec in axes.items():
+            labels[axis], keyed = spec if isinstance(spec, tuple) else (spec, spec)
+            col = df[keys.get(axis, axis)]
+            # position on the axis of every category, then of every row
+            lut = pd.Index(list(keyed)).get_indexer(col.cat.categories)
+            p = np.append(lut, -1)[col.cat.codes.to_numpy()]
+            keep &= p >= 0
+            pos.append(p)
+            shape.append(len(labels[axis]))
+        pos = tuple(p[keep] for p in pos)
+        values = np.full(shape, np.nan, dtype=df['value'].dtype)
+        masks = np.full(shape, flags.MISSING, dtype=flags.dtype)
+        present = np.zeros(shape, dtype=bool)
+        values[pos] = df['value'].to_numpy()[keep]
+        masks[pos] = df['flag'].to_numpy()[keep]
+        present[pos] = True
+        return cls(labels, values, masks, present, attrs)
+
+    def positions(self, axis, labels):
+        # positions of `labels` on `axis`, labels not on the axis are skipped
+        index = self.index[axis]
+        return [index[label] for label in labels if label in index]
+
+    def take(self, **labels):
+        '''
+        Sub-cube by label: a single label or a list of labels per axis (in
+        the order given), all labels of the axes not named.
+        '''
+        axes, attrs, idx = {}, {}, []
+        for axis, all_labels in self.axes.items():
+            if axis not in labels:
+                pos = list(range(len(all_labels)))
+            else:
+                wanted = labels[axis]
+                pos = self.positions(axis, wanted if isinstance(wanted, (list, tuple)) else [wanted])
+            axes[axis] = [all_labels[p] for p in pos]
+            if axis in self.attrs:
+                attrs[axis] = {name: a[pos] for name, a in self.attrs[axis].items()}
+            idx.append(np.array(pos, dtype=np.intp))
+        cells = np.ix_(*idx)
+        return Cube(axes, self.values[cells], self.flags[cells], self.present[cells], attrs)
+
+    def count(self):
+        # number of cells in the panel
+        return int(self.present.sum())
+
+    def frame(self):
+        # one row per cell in the panel, in axis order: axes, attrs, value, flag
+        pos = np.nonzero(self.present)
+        df = {}
+        for i, (axis, labels) in enumerate(self.axes.items()):
+            df[axis] = np.asarray(labels, dtype=object)[pos[i]]
+        for i, axis in enumerate(self.axes):
+            for name, a in self.attrs.get(axis, {}).items():
+                df[name] = a[pos[i]]
+        df['value'] = self.values[pos]
+        df['flag'] = self.flags[pos]
+        return pd.DataFrame(df)
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import hashlib
+import json
+import threading
+import urllib.parse
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import button_store
+
+'''
+
+Local HTTP server for the data of figures with country buttons (dd_trend_*,
+imgpop_top5_*). With `html_data_server` set in plot.py, their html chunks do
+not embed the data of every country: a button fetches the data of its country
+when it is selected (see button_store.py and custom.js), from
+
+    GET /                         figures served (json list)
+    GET /<figure>/                countries of a figure (json list)
+    GET /<figure>/<country>.json  restyle update of that country
+
+where <figure> is the file name of the html chunk (e.g. dd_trend_lfp) and
+<country> the button label (url-encoded). The figures are built from the
+processed data on first request; the encoded responses of the `max_figures`
+figures requested last are kept in memory (least recently used are dropped).
+Every response has an ETag (hash of the body), so clients revalidate with
+If-None-Match and get a 304 without body if nothing changed.
+
+Run with `python src/plot.py --serve` (builds first). The server only listens
+on localhost unless given another host.
+
+'''
+
+class FigureData:
+
+    def __init__(self, figures, max_figures=8, precision=None):
+        # figures: {figure: function returning the plotly figure}
+        self.figures = figures
+        self.max_figures = max_figures
+        self.precision = precision
+        self.stats = {'hit': 0, 'miss': 0}
+        self._cache = OrderedDict() # figure -> {country: (body, etag)}
+        self._lock = threading.Lock()
+        self._building = {} # figure -> lock held while it is built
+
+    def responses(self, figure):
+        # encoded responses of one figure (LRU); a figure is built under a lock
+        # of its own, so requests for other figures are not held up
+        with self._lock:
+            if figure in self._cache:
+                self._cache.move_to_end(figure)
+                self.stats['hit'] += 1
+                return self._cache[figure]
+            building = self._building.setdefault(figure, threading.Lock())
+        with building:
+            with self._lock:
+                if figure in self._cache: # built by a concurrent request
+                    self._cache.move_to_end(figure)
+                    self.stats['hit'] += 1
+                    return self._cache[figure]
+                self.stats['miss'] += 1
+            try:
+                updates = button_store.updates(self.figures[figure]())
+                out = {label: _response(button_store.round_floats(update, self.precision))
+                    for label, update in updates.items()}
+                out[None] = _response(list(updates))
+            except Exception:
+                with self._lock:
+                    self._building.pop(figure, None)
+                raise
+            with self._lock:
+                self._building.pop(figure, None)
+                self._cache[figure] = out
+                while len(self._cache) > self.max_figures:
+                    self._cache.popitem(last=False)
+            return out
+
+    def get(self, path):
+        # (body, etag) for a request path, None if there is no such data
+        parts = [urllib.parse.unquote(p) for p in path.split('?')[0].strip('/').split('/') if p]
+        if len(parts) == 0:
+            return _response(sorted(self.figures))
+        if parts[0] not in self.figures or len(parts) > 2:
+            return None
+        if len(parts) == 2 and not parts[1].endswith('.json'):
+            return None
+        return self.responses(parts[0]).get(parts[1][:-len('.json')] if len(parts) == 2 else None)
+
+
+def _response(value):
+    body = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    data = None # FigureData, set by server()
+
+    def do_GET(self):
+        try:
+            found = self.data.get(self.path)
+        except Exception as e:
+            self._send(500, str(e).encode('utf-8'))
+            return
+        if found is None:
+            self._send(404, b'Not found')
+            return
+        body, etag = found
+        if etag in [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]:
+            self._send(304, etag=etag)
+        else:
+            self._send(200, body, etag, 'application/json')
+
+    def _send(self, status, body=b'', etag=None, content_type='text/plain'):
+        self.send_response(status)
+        # the html chunks are opened from files or another server
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'no-cache') # revalidate with the ETag
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if status != 304:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def server(data, host='127.0.0.1', port=8765):
+    '''
+    HTTP server for `data` (FigureData), e.g.
+
+        with server(data, port=0) as httpd: # any free port
+            threading.Thread(target=httpd.serve_forever, daemon=True).start()
+            url = 'http://127.0.0.1:' + str(httpd.server_port) + '/'
+    '''
+    handler = type('Handler', (Handler,), {'data': data})
+    return ThreadingHTTPServer((host, port), handler)
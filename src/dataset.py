@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import json
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+try:
+    import fcntl
+except ImportError: # Windows
+    import msvcrt
+    fcntl = None
+
+'''
+
+Processed data as partitioned Parquet datasets (instead of pickles, which
+tie the data to a pandas version and can only be read as a whole). A dataset
+is a directory with one file per partition, e.g. by indicator and year:
+
+    data/processed/eurostat/
+        _schema.json
+        var=lfp/year=2019/part.parquet
+        ...
+
+_schema.json holds the schema version, the partition and sort columns and the
+pandas dtypes, which are restored on reading. Readers select partitions and
+columns, only the matching files are read (predicate pushdown):
+
+    read('data/processed/eurostat', var='lfp', year=['2018', '2019'])
+
+A dataset written with another SCHEMA_VERSION raises a ValueError. Writers
+of the same dataset may run concurrently (threads or processes): each writes
+into a tmp directory of its own and the swap is locked with <root>.lock.
+
+'''
+
+SCHEMA_VERSION = 1
+# seconds a writer waits for the lock of a dataset on Windows (flock waits
+# until it is released, which the system does when the holder exits)
+LOCK_TIMEOUT = 600
+
+
+def write(df, root, partition_cols=(), sort=None, partitions=False):
+    '''
+    Write `df` as dataset `root`, replacing it as a whole (or with
+    `partitions=True` only the partitions in `df`, keeping the others). Rows
+    are sorted by `sort` (a list of columns) on reading. Returns the written
+    files.
+    '''
+    root = Path(root)
+    partition_cols = list(partition_cols)
+    root.parent.mkdir(parents=True, exist_ok=True)
+    # every writer has a tmp directory of its own, so that writers of the same
+    # dataset (e.g. the recodes of several UNDESA years, run in parallel
+    # processes) only meet in the schema check and swap, which are locked
+    tmp, files = _write_tmp(df, root, partition_cols, sort)
+    try:
+        with _locked(root):
+            if partitions and exists(root):
+                schema = read_schema(root)
+                if schema['partition_cols'] != partition_cols:
+                    raise ValueError(str(root) + ': partitioned by ' + str(schema['partition_cols'])
+                        + ', not ' + str(partition_cols))
+                if schema['sort'] != sort or schema['dtypes'] != _dtypes(df):
+                    # other dtypes (e.g. an older version): rewrite it all,
+                    # keeping the partitions not in df
+                    keep = read(root)
+                    new = df[partition_cols].astype(str).drop_duplicates()
+                    keep = keep[keep[partition_cols].astype(str).merge(new, how='left', indicator=True)['_merge'].to_numpy() == 'left_only']
+                    df = pd.concat([keep.astype(df.dtypes.to_dict()), df], ignore_index=True)
+                    shutil.rmtree(tmp)
+                    tmp, files = _write_tmp(df, root, partition_cols, sort)
+                    partitions = False
+            # swap in the new version
+            if partitions and exists(root):
+                for file in files:
+                    if (root / file.parent).exists():
+                        shutil.rmtree(root / file.parent)
+                    (root / file.parent).parent.mkdir(parents=True, exist_ok=True)
+                    (tmp / file.parent).rename(root / file.parent)
+                shutil.rmtree(tmp)
+            elif root.exists():
+                old = root.with_name(root.name + '.old')
+                if old.exists(): # left by an interrupted write
+                    shutil.rmtree(old)
+                root.rename(old)
+                tmp.rename(root)
+                shutil.rmtree(old)
+            else:
+                tmp.rename(root)
+    finally:
+        if tmp.exists():
+            shutil.rmtree(tmp, ignore_errors=True)
+    return [str(root / '_schema.json')] + [str(root / file) for file in files]
+
+
+def _dtypes(df):
+    return {col: str(dtype) for col, dtype in df.dtypes.items()}
+
+
+def _write_tmp(df, root, partition_cols, sort):
+    # write df as dataset into a new tmp directory next to root
+    tmp = Path(tempfile.mkdtemp(prefix=root.name + '.', suffix='.tmp', dir=root.parent))
+    tmp.chmod(root.parent.stat().st_mode & 0o777) # not private once swapped in
+    schema = {
+        'version': SCHEMA_VERSION,
+        'partition_cols': partition_cols,
+        'sort': sort,
+        'dtypes': _dtypes(df),
+    }
+    with open(tmp / '_schema.json', 'w') as file:
+        json.dump(schema, file, indent=1)
+    files = []
+    if len(partition_cols) > 0:
+        by = partition_cols[0] if len(partition_cols) == 1 else partition_cols
+        parts = df.groupby(by, sort=True, observed=True)
+    else:
+        parts = [((), df)]
+    for keys, part in parts:
+        keys = keys if isinstance(keys, tuple) else (keys,)
+        path = Path(*[col + '=' + str(key) for col, key in zip(partition_cols, keys)])
+        (tmp / path).mkdir(parents=True, exist_ok=True)
+        part = part.drop(columns=partition_cols)
+        # categories are restored from the schema, store the labels only
+        for col in part.columns[part.dtypes == 'category']:
+            part[col] = part[col].astype(str)
+        part.to_parquet(tmp / path / 'part.parquet', index=False)
+        files.append(path / 'part.parquet')
+    return tmp, files
+
+
+@contextmanager
+def _locked(root):
+    # exclusive lock on <root>.lock, across threads and processes
+    with open(root.with_name(root.name + '.lock'), 'a+b') as file:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        else:
+            file.seek(0)
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while True:
+                try: # LK_LOCK itself retries for about 10s, then raises
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise TimeoutError(str(root) + ': still locked by another writer after '
+                            + str(LOCK_TIMEOUT) + 's (' + file.name + ')')
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            else:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_schema(root):
+    with open(Path(root) / '_schema.json') as file:
+        schema = json.load(file)
+    if schema['version'] != SCHEMA_VERSION:
+        raise ValueError(str(root) + ': schema version ' + str(schema['version'])
+            + ', expected ' + str(SCHEMA_VERSION))
+    return schema
+
+
+def exists(root):
+    return (Path(root) / '_schema.json').exists()
+
+
+def read(root, columns=None, **where):
+    '''
+    Read dataset `root`: only `columns` (default: all) of the partitions
+    whose columns equal the values in `where` (one value or a list).
+    '''
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    meta = read_schema(root)
+    partitioning = ds.partitioning(pa.schema([(col, pa.string()) for col in meta['partition_cols']]),
+        flavor='hive')
+    dataset = ds.dataset(str(root), format='parquet', partitioning=partitioning)
+    expr = None
+    for col, value in where.items():
+        values = [str(v) for v in (value if isinstance(value, (list, tuple, set)) else [value])]
+        cond = ds.field(col).isin(values)
+        expr = cond if expr is None else expr & cond
+    columns = list(meta['dtypes']) if columns is None else list(columns)
+    table = dataset.to_table(columns=columns, filter=expr)
+    # categoricals are dictionary encoded by arrow (categories sorted below)
+    for i, col in enumerate(table.column_names):
+        if meta['dtypes'][col] == 'category':
+            table = table.set_column(i, col, table.column(i).dictionary_encode())
+    df = table.to_pandas()
+    for col in columns:
+        dtype = meta['dtypes'][col]
+        if dtype == 'category':
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+        elif dtype != str(df[col].dtype):
+            df[col] = df[col].astype(dtype)
+    sort = [col for col in meta['sort'] or [] if col in columns]
+    if len(sort) > 0:
+        df = df.sort_values(sort, kind='mergesort').reset_index(drop=True)
+    return df[columns]
+
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+import urllib.error
+import urllib.request
+import urllib.response
+from email.message import Message
+from pathlib import Path
+
+'''
+
+On-disk cache for everything plot.py downloads (UNDESA workbooks, Eurostat bulk
+tables and dictionaries). Entries are keyed by source URL (which carries the
+Eurostat table code) and point to content-addressed blobs, so identical files
+are stored only once:
+
+    <root>/index.json          url -> sha256, size, etag, last_modified, ...
+    <root>/objects/ab/ab12...  raw response bodies
+
+Within `ttl` seconds of the last validation an entry is served without any
+network access. After that, it is revalidated with a conditional request
+(If-None-Match / If-Modified-Since); a 304 only refreshes the timestamp. If the
+server cannot be reached (or `offline=True`), the cached copy is served no
+matter how old it is. Once the blobs exceed `max_bytes`, the least recently
+used entries are evicted. Access times of hits are only kept in memory and
+written with the next change of the index or by flush() (at the latest on
+exit), so that a hit does not rewrite index.json.
+
+Libraries that fetch via urllib (eurostat, pandas.read_excel) are routed through
+the cache by installing `CacheHandler` as global opener, see `install()`.
+
+'''
+
+class CacheMiss(Exception):
+    pass
+
+
+class DownloadCache:
+
+    def __init__(self, root, ttl=7*24*3600, max_bytes=2*1024**3, offline=False, timeout=100):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.timeout = timeout
+        self.stats = {'hit': 0, 'revalidated': 0, 'download': 0, 'stale': 0}
+        self._lock = threading.RLock()
+        self._url_locks = defaultdict(threading.Lock)
+        self._local = threading.local()
+        # plain opener for the actual transfers (never routed through the cache)
+        self._opener = urllib.request.build_opener()
+        (self.root / 'objects').mkdir(parents=True, exist_ok=True)
+        self._index_file = self.root / 'index.json'
+        try:
+            with open(self._index_file, 'r') as file:
+                self.index = json.load(file)
+        except (OSError, ValueError):
+            self.index = {}
+        self._dirty = False
+        atexit.register(self.flush)
+
+    ###  public  ###############################################################
+
+    def fetch(self, url):
+        # returns the path of the cached response body for `url`; concurrent
+        # requests for the same url wait for a single transfer
+        with self._lock:
+            url_lock = self._url_locks[url]
+        with url_lock:
+            return self._fetch(url)
+
+    @contextmanager
+    def request_timeout(self, seconds):
+        # per-thread socket timeout for transfers started within the block
+        previous = getattr(self._local, 'timeout', None)
+        self._local.timeout = seconds
+        try:
+            yield
+        finally:
+            self._local.timeout = previous
+
+    def read(self, url):
+        with open(self.fetch(url), 'rb') as file:
+            return file.read()
+
+    def install(self):
+        # route urllib.request.urlopen (eurostat, pandas) through the cache
+        urllib.request.install_opener(urllib.request.build_opener(CacheHandler(self)))
+        return self
+
+    def flush(self):
+        # write access times of hits not yet in index.json
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def entry(self, url):
+        # copy of the index entry of `url` (the index is changed by other
+        # fetching threads)
+        with self._lock:
+            return dict(self.index[url])
+
+    def size(self):
+        # total size of all blobs (shared blobs counted once)
+        with self._lock:
+            return sum({e['sha256']: e['size'] for e in self.index.values()}.values())
+
+    def evict(self, max_bytes=None, keep=()):
+        # drop least recently used entries until blobs fit into max_bytes;
+        # blobs are only deleted once no entry references them anymore
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._lock:
+            by_access = sorted(self.index, key=lambda u: self.index[u]['accessed'])
+            refs = defaultdict(int) # entries per blob
+            for entry in self.index.values():
+                refs[entry['sha256']] += 1
+            total = self.size()
+            for url in by_access:
+                if total <= max_bytes:
+                    break
+                if url in keep:
+                    continue
+                entry = self.index.pop(url)
+                refs[entry['sha256']] -= 1
+                if refs[entry['sha256']] == 0:
+                    self._blob(entry['sha256']).unlink(missing_ok=True)
+                    total -= entry['size']
+            self._save()
+
+    ###  internals  ############################################################
+
+    def _fetch(self, url):
+        with self._lock:
+            entry = self.index.get(url)
+        if entry is not None and self._blob(entry['sha256']).exists():
+            if self.offline or time.time() - entry['validated'] < self.ttl:
+                self._count('hit')
+                return self._touch(url)
+            return self._revalidate(url, entry)
+        if self.offline:
+            raise CacheMiss('Offline and not cached: ' + url)
+        return self._download(url)
+
+    def _count(self, outcome):
+        with self._lock:
+            self.stats[outcome] += 1
+
+    def _blob(self, sha):
+        return self.root / 'objects' / sha[:2] / sha
+
+    def _request(self, url, headers={}):
+        req = urllib.request.Request(url, headers=headers)
+        timeout = getattr(self._local, 'timeout', None) or self.timeout
+        return self._opener.open(req, timeout=timeout)
+
+    def _download(self, url):
+        with self._request(url) as resp:
+            body = resp.read()
+            headers = resp.headers
+        self._count('download')
+        return self._store(url, body, headers)
+
+    def _revalidate(self, url, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        try:
+            with self._request(url, headers) as resp:
+                body = resp.read()
+                resp_headers = resp.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                self._count('revalidated')
+                with self._lock:
+                    self.index[url]['validated'] = time.time()
+                    self._save()
+                return self._touch(url)
+            return self._stale(url, e)
+        except (urllib.error.URLError, OSError) as e:
+            return self._stale(url, e)
+        self._count('download')
+        return self._store(url, body, resp_headers)
+
+    def _stale(self, url, err):
+        # server unreachable: fall back to the (outdated) local copy
+        print('Using cached copy of ' + url + ' (' + str(err) + ')')
+        self._count('stale')
+        return self._touch(url)
+
+    def _store(self, url, body, headers):
+        sha = hashlib.sha256(body).hexdigest()
+        blob = self._blob(sha)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_suffix('.tmp' + str(threading.get_ident()))
+            with open(tmp, 'wb') as file:
+                file.write(body)
+            os.replace(tmp, blob)
+        now = time.time()
+        with self._lock:
+            self.index[url] = {
+                'sha256': sha,
+                'size': len(body),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified'),
+                'content_type': headers.get('Content-Type'),
+                'content_encoding': headers.get('Content-Encoding'),
+                'validated': now,
+                'accessed': now,
+            }
+            if self.size() > self.max_bytes:
+                self.evict(keep=(url,))
+            self._save()
+        return blob
+
+    def _touch(self, url):
+        with self._lock:
+            entry = self.index[url]
+            entry['accessed'] = time.time()
+            self._dirty = True # written by flush() or the next _save()
+            return self._blob(entry['sha256'])
+
+    def _save(self):
+        tmp = self._index_file.with_suffix('.tmp')
+        with open(tmp, 'w') as file:
+            json.dump(self.index, file, indent=1, sort_keys=True)
+        os.replace(tmp, self._index_file)
+        self._dirty = False
+
+
+class CacheHandler(urllib.request.BaseHandler):
+    # urllib handler answering plain GET requests from a DownloadCache
+    handler_order = 100
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def default_open(self, req):
+        if req.type not in ('http', 'https') or req.get_method() != 'GET' or req.data is not None:
+            return None
+        url = req.full_url
+        path = self.cache.fetch(url)
+        headers = Message()
+        entry = self.cache.entry(url)
+        headers['Content-Length'] = str(entry['size'])
+        for field in ['content_type', 'content_encoding']:
+            if entry.get(field):
+                headers[field.replace('_', '-').title()] = entry[field]
+        resp = urllib.response.addinfourl(open(path, 'rb'), headers, url, 200)
+        resp.msg = 'OK'
+        return resp
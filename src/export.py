@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import plotly.io as pio
+
+'''
+
+Static image export queue. Rendering with kaleido takes seconds per file, so
+figures are not written on the spot: `add()` serializes the figure once and
+lists all files to be made from it (svg, pdf and optional png at several DPIs),
+and `run()` renders the queued figures in a pool of worker processes. All files
+of one figure are rendered by the same worker from the same spec (sent to the
+worker and decoded there once), using the persistent kaleido session of that
+process. kaleido itself encodes the figure again for every file it renders;
+its public API takes a figure, not a serialized spec. Errors are collected per
+file instead of aborting the whole export.
+
+With a `cache` (see export_cache.py), files whose figure spec and settings
+were rendered before are taken from the cache instead, and newly rendered ones
+are added to it.
+
+'''
+
+# png scale relative to the css pixel grid plotly uses for width/height
+CSS_DPI = 96
+
+
+class Output:
+
+    def __init__(self, file, format, width=None, height=None, scale=1):
+        self.file = file
+        self.format = format
+        self.width = width
+        self.height = height
+        self.scale = scale
+
+
+class Renderer:
+    '''
+    Thin wrapper around the kaleido scope of the current process (public API,
+    as plotly's to_image): the figure json is decoded once per figure and the
+    same dict is rendered to every format (kaleido encodes it per request).
+    '''
+
+    def __init__(self):
+        self.scope = pio.kaleido.scope
+
+    def render(self, fig, output):
+        # fig: figure dict, returns the image bytes (raises on failure)
+        return self.scope.transform(fig, format=output.format, width=output.width,
+            height=output.height, scale=output.scale)
+
+
+def _write(file, img):
+    # replace the file instead of writing into it (it may be a hard link to a
+    # cached image)
+    tmp = file + '.tmp' + str(os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(img)
+    os.replace(tmp, file)
+
+
+_renderer = None
+
+def _render_all(spec, outputs):
+    # renders all outputs of one figure, returns [(file, error, seconds)]
+    global _renderer
+    if _renderer is None:
+        _renderer = Renderer()
+    results = []
+    fig = json.loads(spec)
+    for output in outputs:
+        start = time.perf_counter()
+        try:
+            _write(output.file, _renderer.render(fig, output))
+            results.append((output.file, None, time.perf_counter() - start))
+        except Exception:
+            results.append((output.file, traceback.format_exc(limit=3), time.perf_counter() - start))
+    return results
+
+
+class ExportQueue:
+
+    def __init__(self, workers=None, formats=('svg', 'pdf'), png_dpi=(), cache=None):
+        self.workers = os.cpu_count() if workers is None else workers
+        self.formats = formats
+        self.png_dpi = png_dpi
+        self.cache = cache
+        self.jobs = []
+        self.seconds = {} # file -> render time of the files exported so far
+
+    def add(self, fig, stem, width=None, height=None, formats=None, png_dpi=None):
+        '''
+        Queue `fig` for export to `stem`.<format> for every format and to
+        `stem`_<dpi>dpi.png for every png resolution (defaults from the queue).
+        Returns the files to be written.
+        '''
+        formats = self.formats if formats is None else formats
+        png_dpi = self.png_dpi if png_dpi is None else png_dpi
+        width = width or fig.layout.width or pio.kaleido.scope.default_width
+        height = height or fig.layout.height or pio.kaleido.scope.default_height
+        outputs = [Output(stem + '.' + f, f, width, height) for f in formats]
+        outputs += [Output(stem + '_' + str(dpi) + 'dpi.png', 'png', width, height, dpi / CSS_DPI)
+            for dpi in png_dpi]
+        # serialize now: the figure object may be changed after queueing
+        self.jobs.append((pio.to_json(fig, validate=False, remove_uids=False), outputs))
+        return [o.file for o in outputs]
+
+    def run(self, verbose=True):
+        # returns {file: error message} for all failed files
+        start = time.perf_counter()
+        jobs, cached, keys = self.jobs, [], {}
+        if self.cache is not None:
+            jobs = []
+            for spec, outputs in self.jobs:
+                render = []
+                for o in outputs:
+                    keys[o.file] = self.cache.key(spec, o.format, o.width, o.height, o.scale)
+                    if self.cache.fetch(keys[o.file], o.file):
+                        cached.append(o.file)
+                    else:
+                        render.append(o)
+                if len(render) > 0:
+                    jobs.append((spec, render))
+        if self.workers <= 1:
+            results = [r for spec, outputs in jobs for r in _render_all(spec, outputs)]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(_render_all, spec, outputs) for spec, outputs in jobs]
+                results = [r for f in as_completed(futures) for r in f.result()]
+        failed = {file: err for file, err, secs in results if err is not None}
+        if self.cache is not None:
+            for file, err, secs in results:
+                if err is None:
+                    self.cache.store(keys[file], file)
+        self.seconds.update({file: round(secs, 3) for file, err, secs in results})
+        self.seconds.update({file: 0 for file in cached})
+        if verbose:
+            for file, err, secs in sorted(results):
+                print(('FAILED ' if err else 'Exported ') + os.path.basename(file)
+                    + ' (' + format(secs, '.1f') + 's)' + ('\n' + err if err else ''))
+            print('Exported ' + str(len(results) - len(failed)) + '/' + str(len(results))
+                + ' images in ' + format(time.perf_counter() - start, '.1f') + 's using '
+                + str(max(self.workers, 1)) + ' worker(s)'
+                + (', ' + str(len(cached)) + ' unchanged from cache' if self.cache is not None else ''))
+        self.jobs = []
+        return failed
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import hashlib
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+'''
+
+On-disk cache of rendered static images. Most builds export figures whose
+spec did not change, so every file is keyed by a hash of what determines its
+content (serialized figure spec, format, width, height, scale and the plotly/
+kaleido versions):
+
+    <root>/objects/ab/ab12....svg   rendered images
+
+An export whose key is in the cache is hard-linked (`link=True`, falls back to
+a copy across file systems) or copied to its destination instead of being
+rendered. Files written by the renderer replace the destination (see
+export._write), so a hard-linked cache object is never written through.
+
+Eviction is least recently used by file modification time (set on every hit):
+once the objects exceed `max_bytes`, the oldest are deleted (see evict()).
+There is no index, so worker processes can share the cache without locking.
+`stats` counts hits, misses, stores and evictions of this process.
+
+'''
+
+class ExportCache:
+
+    def __init__(self, root, max_bytes=512*1024**2, link=True):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.link = link
+        self.stats = {'hit': 0, 'miss': 0, 'stored': 0, 'evicted': 0}
+        self._versions = _versions()
+
+    def key(self, spec, format, width=None, height=None, scale=1):
+        # sha256 of the serialized spec and the export settings
+        settings = json.dumps([format, width, height, scale, self._versions])
+        return hashlib.sha256((settings + '\n' + spec).encode('utf-8')).hexdigest()
+
+    def fetch(self, key, file):
+        # put the cached image `key` at `file`; False if not cached
+        blob = self._blob(key, file)
+        try:
+            _place(blob, file, self.link)
+            os.utime(blob) # recently used
+        except FileNotFoundError:
+            self.stats['miss'] += 1
+            return False
+        self.stats['hit'] += 1
+        return True
+
+    def store(self, key, file):
+        # add the rendered image `file` as `key`
+        blob = self._blob(key, file)
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = blob.with_name(blob.name + '.tmp' + str(os.getpid()) + '_' + str(threading.get_ident()))
+        shutil.copyfile(file, tmp)
+        os.replace(tmp, blob)
+        self.stats['stored'] += 1
+
+    def size(self):
+        return sum(f.stat().st_size for f in self._objects())
+
+    def evict(self, max_bytes=None):
+        # delete least recently used objects until they fit into max_bytes
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        objects = sorted(((f.stat().st_mtime, f.stat().st_size, f) for f in self._objects()),
+            key=lambda o: o[0])
+        size = sum(o[1] for o in objects)
+        for mtime, fsize, blob in objects:
+            if size <= max_bytes:
+                break
+            blob.unlink(missing_ok=True)
+            size -= fsize
+            self.stats['evicted'] += 1
+        return size
+
+    def report(self):
+        # hit/miss counts of this process and the state of the cache
+        files = list(self._objects())
+        total = self.stats['hit'] + self.stats['miss']
+        return dict(self.stats, hit_rate=round(self.stats['hit'] / total, 3) if total else None,
+            objects=len(files), bytes=sum(f.stat().st_size for f in files))
+
+    def _blob(self, key, file):
+        return self.root / 'objects' / key[:2] / (key + Path(file).suffix)
+
+    def _objects(self):
+        return (f for f in (self.root / 'objects').glob('*/*') if '.tmp' not in f.name)
+
+
+def _versions():
+    # the renderer is part of the key: a new plotly/kaleido may draw differently
+    import plotly
+    try:
+        import kaleido
+        return [plotly.__version__, getattr(kaleido, '__version__', None)]
+    except ImportError:
+        return [plotly.__version__, None]
+
+
+def _place(blob, file, link):
+    # hard link or copy blob to file (replacing it)
+    tmp = str(file) + '.tmp' + str(os.getpid())
+    if link:
+        try:
+            os.link(blob, tmp)
+        except FileNotFoundError:
+            raise
+        except OSError: # e.g. other file system
+            shutil.copyfile(blob, tmp)
+    else:
+        shutil.copyfile(blob, tmp)
+    os.replace(tmp, file)
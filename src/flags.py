@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+
+'''
+
+Eurostat quality flags as bitmasks. The flag strings of the bulk downloads
+(e.g. 'bu' = break in time series, low reliability) are parsed once into one
+uint16 per cell, stored in the 'flag' columns next to the values:
+
+    b break in time series      p provisional
+    c confidential              r revised
+    d definition differs        s Eurostat estimate
+    e estimated                 u low reliability
+    f forecast                  z not applicable
+    n not significant           : not available (no value)
+
+Cells without data (NaN flags, e.g. origin groups missing for a country) get
+the MISSING bit, so that the flags of a gap are simply the bitwise OR of the
+flags of both operands and "no data" propagates. Tests are vectorized:
+
+    has(df['flag'], 'u')    # boolean array, low reliability
+
+'''
+
+dtype = np.uint16
+letters = 'bcdefnprsuz:'
+bits = {letter: 1 << i for i, letter in enumerate(letters)}
+MISSING = 1 << 15
+
+
+def encode(values):
+    # flag strings (NaN: no data) -> bitmasks, parsed once per distinct string
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    lut = np.array([sum(bits.get(c, 0) for c in set(str(u))) for u in uniques] + [MISSING], dtype=dtype)
+    return lut[codes] # code -1 (NaN) takes the last entry
+
+
+def decode(masks):
+    # bitmasks -> flag strings (NaN for MISSING), e.g. for display
+    masks = np.asarray(masks)
+    out = np.full(masks.shape, '', dtype=object)
+    for letter, bit in bits.items():
+        out = np.where(masks & bit, out + letter, out)
+    return np.where(masks & MISSING, np.nan, out)
+
+
+def has(masks, flag):
+    # True where any of the letters in `flag` is set
+    return (np.asarray(masks) & sum(bits[c] for c in flag)) != 0
+
+
+def missing(masks):
+    return (np.asarray(masks) & MISSING) != 0
+
+
+def _flag_columns(df):
+    if isinstance(df.columns, pd.MultiIndex):
+        return df.columns[df.columns.get_level_values('info') == 'flag']
+    return df.columns[df.columns == 'flag']
+
+
+def encode_frame(df):
+    # encode all flag columns that still hold strings (in one pass)
+    cols = [col for col in _flag_columns(df) if df[col].dtype == object]
+    masks = encode(df[cols].to_numpy().ravel()).reshape(len(df), len(cols))
+    df = df.copy()
+    for i, col in enumerate(cols):
+        df[col] = masks[:, i]
+    return df
+
+
+def dropna(df):
+    '''
+    Stacking with dropna=False leaves NaN flags for cells that do not exist;
+    set them to MISSING and drop rows without any data (all flags MISSING),
+    as stack(dropna=True) does with NaN.
+    '''
+    cols = _flag_columns(df)
+    masks = df[cols].fillna(MISSING).to_numpy().astype(dtype)
+    keep = ~missing(masks).all(axis=1)
+    df = df[keep].copy()
+    for i, col in enumerate(cols):
+        df[col] = masks[keep, i]
+    return df
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+
+'''
+
+Nativity and gender gap engine. Values are held in an array whose last two
+axes are c_birth and sex, e.g. (indicator, country, year, c_birth, sex) or
+(row, c_birth, sex) for a single indicator. All contrasts for all immigrant
+groups are computed in one broadcast operation: the operands are gathered with
+one fancy index per side and subtracted at once.
+
+A contrast is named by the measure it creates and compares two cells given as
+(c_birth, sex). `IMM` stands for each of the immigrant groups in turn, so a new
+contrast only needs a new entry in `contrasts`, e.g.
+
+    'imnm': (('IMM', 'M'), ('NAT', 'M')) # immigrant men vs. native men
+
+'''
+
+IMM = 'IMM'
+
+contrasts = {
+    'iwnw': ((IMM, 'F'), ('NAT', 'F')), # immigrant women vs. native women
+    'iwim': ((IMM, 'F'), (IMM, 'M')), # immigrant women vs. immigrant men
+    'iwnm': ((IMM, 'F'), ('NAT', 'M')), # immigrant women vs. native men
+}
+
+
+def _index(sides, c_birth, sex, groups):
+    # positions of one side of every contrast: c_birth (contrast, group), sex (contrast, 1)
+    cb = np.array([[c_birth.index(g if s[0] == IMM else s[0]) for g in groups] for s in sides])
+    sx = np.array([[sex.index(s[1])] for s in sides])
+    return cb, sx
+
+
+def gaps(values, c_birth, sex, groups, contrasts=contrasts, flags=None):
+    '''
+    Gaps of all `contrasts` for all immigrant `groups` (labels in `c_birth`).
+    `values` (and `flags`) have the c_birth and sex axes last, labelled by
+    `c_birth` and `sex`. Returns an array (..., contrast, group, sex): gaps are
+    constant per gender, i.e. repeated along the sex axis. If `flags` (integer
+    bitmasks, see flags.py) are given, also returns the flags of both operands
+    combined by bitwise OR.
+    '''
+    c_birth, sex = list(c_birth), list(sex)
+    lhs_cb, lhs_sx = _index([c[0] for c in contrasts.values()], c_birth, sex, groups)
+    rhs_cb, rhs_sx = _index([c[1] for c in contrasts.values()], c_birth, sex, groups)
+    shape = values.shape[:-2] + lhs_cb.shape + (len(sex),)
+    gap = values[..., lhs_cb, lhs_sx] - values[..., rhs_cb, rhs_sx]
+    gap = np.broadcast_to(gap[..., None], shape)
+    if flags is None:
+        return gap
+    flag = flags[..., lhs_cb, lhs_sx] | flags[..., rhs_cb, rhs_sx]
+    return gap, np.broadcast_to(flag[..., None], shape)
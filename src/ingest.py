@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import hashlib
+import json
+from pathlib import Path
+import pandas as pd
+
+'''
+
+Single-pass workbook ingestion. Parsing xlsx is by far the slowest step of the
+UNDESA section, so every workbook is opened once (one pd.ExcelFile for all
+sheets) and each parsed sheet is stored as Parquet in `store`. The file names
+carry a hash of the workbook content and the parse options, so later runs read
+the columnar copy directly and a changed workbook is parsed again.
+
+'''
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024*1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _arrow_safe(df):
+    # Parquet needs string column names and one type per column: mostly numeric
+    # object columns become numeric (notes, '..' and header text become NaN),
+    # other mixed columns become strings (NaN kept)
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if values.map(type).eq(str).all():
+            continue
+        numeric = pd.to_numeric(values, errors='coerce')
+        if numeric.notnull().mean() > 0.5:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+        else:
+            df[col] = df[col].where(df[col].isnull(), df[col].astype(str))
+    return df
+
+
+def read_workbook(path, sheets, store, label=None):
+    '''
+    Read several sheets of one workbook, e.g.
+
+        read_workbook(path, {'F': dict(sheet_name='Table 2', header=[15])}, store)
+
+    returns {'F': DataFrame}. Keyword arguments are passed to ExcelFile.parse.
+    `label` names the stored files (default: workbook file name).
+    '''
+    label = Path(path).stem if label is None else label
+    store = Path(store)
+    store.mkdir(parents=True, exist_ok=True)
+    sha = _file_hash(path)
+    files = {}
+    for name, kwargs in sheets.items():
+        key = hashlib.sha256((sha + json.dumps(kwargs, sort_keys=True)).encode()).hexdigest()[:16]
+        files[name] = store / (label + '_' + name + '_' + key + '.parquet')
+
+    # parse only what is missing, opening the workbook once
+    missing = [name for name, file in files.items() if not file.exists()]
+    if len(missing) > 0:
+        with pd.ExcelFile(path) as xl:
+            for name in missing:
+                df = _arrow_safe(xl.parse(**sheets[name]))
+                df.to_parquet(files[name], index=False)
+                # drop columnar copies of outdated workbook versions
+                for old in store.glob(label + '_' + name + '_*.parquet'):
+                    if old != files[name]:
+                        old.unlink()
+
+    return {name: pd.read_parquet(file) for name, file in files.items()}
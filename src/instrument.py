@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+try: # not on Windows
+    import resource
+except ImportError:
+    resource = None
+
+'''
+
+Run report: what each build stage cost. A Report measures every stage it is
+given (see Build.run) and records
+
+- wall and CPU time (s)
+- peak RSS of the process so far and how much the stage raised it (MB)
+- optional: peak of the memory allocated by Python during the stage
+  (tracemalloc, MB; slows the stage down severalfold)
+- rows processed and bytes written (the 'files' of the stage output)
+- details the stage adds itself, e.g. seconds per source or per html write
+
+and writes them as JSON (see write()). With `profile_dir`, every stage is
+also run under cProfile and dumped to <profile_dir>/<stage>.prof (view e.g.
+with `python -m pstats` or snakeviz).
+
+Stage code adds to the record of the running stage with count(), note() and
+section(); without a report these do nothing, so an uninstrumented build only
+pays for one check per call.
+
+'''
+
+# record of the stage measured right now (in this process)
+current = None
+
+
+def _max_rss():
+    # peak resident set size of the process in MB (kB on Linux, bytes on macOS)
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024**2 if sys.platform == 'darwin' else rss / 1024
+
+
+def count(rows):
+    # rows processed by the running stage
+    if current is not None:
+        current['rows'] = current.get('rows', 0) + int(rows)
+
+
+def note(**fields):
+    # details of the running stage
+    if current is not None:
+        current.update(fields)
+
+
+@contextmanager
+def section(name):
+    # wall time of a part of the running stage, e.g. with section('html'): ...
+    if current is None:
+        yield
+        return
+    record = current
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        sections = record.setdefault('sections', {})
+        sections[name] = round(sections.get(name, 0) + time.perf_counter() - start, 4)
+
+
+def bytes_written(files):
+    return sum(os.path.getsize(f) for f in files if os.path.exists(f))
+
+
+class Report:
+
+    def __init__(self, trace_memory=False, profile_dir=None):
+        self.trace_memory = trace_memory
+        self.profile_dir = profile_dir
+        self.records = {}
+        self.started = time.strftime('%Y-%m-%d %H:%M:%S')
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def measure(self, name):
+        '''
+        Measure the block as stage `name`, e.g.
+
+            with report.measure('recode_lfp') as record:
+                output = func()
+                record['files'] = output.get('files', [])
+        '''
+        global current
+        record = {'pid': os.getpid()}
+        rss = _max_rss()
+        if self.trace_memory:
+            tracemalloc.start()
+        profile = cProfile.Profile() if self.profile_dir is not None else None
+        outer, current = current, record
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield record
+        finally:
+            if profile is not None:
+                profile.disable()
+            record['wall'] = round(time.perf_counter() - wall, 4)
+            record['cpu'] = round(time.process_time() - cpu, 4)
+            current = outer
+            if self.trace_memory:
+                record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024**2, 2)
+                tracemalloc.stop()
+            if rss is not None:
+                record['max_rss_mb'] = round(_max_rss(), 1)
+                record['rss_growth_mb'] = round(_max_rss() - rss, 1)
+            record['bytes_written'] = bytes_written(record.pop('files', []))
+            if profile is not None:
+                Path(self.profile_dir).mkdir(parents=True, exist_ok=True)
+                record['profile'] = str(Path(self.profile_dir) / (name + '.prof'))
+                profile.dump_stats(record['profile'])
+            self.records[name] = record
+
+    def add(self, name, record):
+        # record measured elsewhere, e.g. in a worker process
+        self.records[name] = record
+
+    def write(self, file):
+        report = {
+            'started': self.started,
+            'wall': round(time.perf_counter() - self._start, 4),
+            'trace_memory': self.trace_memory,
+            'stages': self.records,
+        }
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        with open(file, 'w') as f:
+            json.dump(report, f, indent=1, default=str)
+        return file
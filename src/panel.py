@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+import flags
+
+'''
+
+Canonical (long) format of the processed Eurostat panel: one row per existing
+cell, keyed by
+
+    var, country, year, c_birth, sex, measure    (categoricals)
+
+with the columns value (float64) and flag (uint16 bitmask, see flags.py).
+Cells without data are not stored, so there is no NaN padding and the size
+grows with the number of observations, not with the product of all
+dimensions. Rows are ordered by the keys (categories in lexical order).
+
+The recode builds this frame directly from arrays (see tidy()); only the
+migration of older wide frames (from_wide()) reshapes with pandas.
+
+'''
+
+keys = ['var', 'country', 'year', 'c_birth', 'sex', 'measure']
+
+
+def tidy(var, axes, value, flag):
+    '''
+    Long frame of one indicator `var` from the arrays `value` and `flag`
+    (bitmasks) whose axes are labelled by `axes`, a dict with the keys
+    country, year, c_birth, sex, measure (in this order). Cells flagged
+    MISSING are left out.
+    '''
+    pos = np.nonzero(~flags.missing(flag))
+    df = pd.DataFrame({'var': pd.Categorical.from_codes(np.zeros(len(pos[0]), dtype=np.int8), [var])})
+    for i, (key, labels) in enumerate(axes.items()):
+        df[key] = pd.Categorical.from_codes(pos[i], categories=list(labels))
+    df['value'] = value[pos].astype(np.float64)
+    df['flag'] = flag[pos].astype(flags.dtype)
+    return df
+
+
+def concat(frames):
+    # stack long frames, merging the categories of the keys
+    frames = list(frames)
+    df = pd.DataFrame({key: union_categoricals([f[key] for f in frames], sort_categories=True)
+        for key in keys})
+    for col in ['value', 'flag']:
+        df[col] = np.concatenate([f[col].to_numpy() for f in frames])
+    return df
+
+
+def select(df, var):
+    # rows of one indicator
+    return df[df['var'] == var].reset_index(drop=True)
+
+
+def from_wide(df):
+    '''
+    Long frame from the former wide format (index country, year, c_birth, sex;
+    columns var, measure, info), e.g. older copies of
+    data/processed/eurostat.pkl.
+    '''
+    df = flags.encode_frame(df)
+    df = flags.dropna(df.stack(['var', 'measure'], dropna=False)).reset_index()
+    for key in keys:
+        df[key] = pd.Categorical(df[key].astype(str))
+    df['value'] = df['value'].astype(np.float64)
+    df['flag'] = df['flag'].astype(flags.dtype)
+    return df[keys + ['value', 'flag']].sort_values(keys, kind='mergesort').reset_index(drop=True)
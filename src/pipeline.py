@@ -0,0 +1,1115 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import copy
+import html
+import json
+import re
+import uuid
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.io as pio
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from plotly.utils import PlotlyJSONEncoder
+import eurostat as es
+
+### plotly
+# custom theme including some Paul Tol color lists (https://personal.sron.nl/~pault/)
+# colors_hcontrast_opaque / colors_hcontrast_transp (opacity 50%)
+# colors_vibrant_opaque / colors_vibrant_transp (transp = default)
+# colors_paired_opaque / colors_paired_transp (consecutive pairs similar colors)
+import plotly_custom_theme as ptheme
+# figure traces are sliced from a partition index instead of boolean masks
+import traces
+# workbooks are parsed once (all sheets) and kept as Parquet
+import ingest
+# nativity and gender gaps
+import gaps
+# quality flags as bitmasks
+import flags
+# Eurostat tables are streamed and filtered while decompressing
+import bulk
+# country labels, groups and order
+import countries
+# long format of the Eurostat panel
+import panel
+# Eurostat panel as dense cube for the figures
+import cube
+# processed data as partitioned Parquet datasets
+import dataset
+# country buttons can share one data table instead of embedding copies
+import button_store
+# source locations and indicators
+import sources
+# UNDESA migrant stocks as (sex x destination x origin) tensor
+import stocks
+# tables that are neither cached nor reachable (offline)
+from download_cache import CacheMiss
+
+'''
+
+Data preparation and figure builders. Nothing is run on import: the
+UndesaSource, EurostatPanel and Figures classes at the end evaluate what is
+asked for, on first access. The build stages in plot.py use them, so that only
+stale stages pay for loading pandas/plotly and for the actual work. Figure
+builders return the plotly figure; writing images is left to the caller.
+
+'''
+
+# interactive content base settings and chunk regex
+# exported html will be stripped of first set of <div> tags and leading and
+# trailing whitespace for the remaining code, in one pass over the html in
+# memory
+chunk_regex = re.compile(r'(<div>)\s*|\s+(</div>)|\s*(</?script)')
+
+def phtml_chunk(figobj, figfile, precision=None, data_file=None, data_url=None):
+    '''
+    Write the figure as html chunk, returns the files written. `precision`
+    rounds the numbers of the figure json to that many decimals (plotly writes
+    them with full float64 precision); strings are left as they are. With
+    `data_file`, the chunk is only a placeholder and the figure (data, layout
+    and config as json) goes to `data_file`, which custom.js fetches from
+    `data_url` and renders once the placeholder scrolls into view.
+    '''
+    # make bg transparent
+    figobj.update_layout(paper_bgcolor = 'rgba(255,255,255,0)')
+    fig = figobj
+    if precision is not None:
+        # plain json values (numpy arrays, dates etc. as plotly encodes them)
+        fig = button_store.round_floats(json.loads(pio.to_json(figobj, validate=False)), precision)
+    if data_file is not None:
+        # figure json as plotly writes it into the html, then the placeholder
+        fig = fig if isinstance(fig, dict) else fig.to_dict()
+        spec = ('{"data": ' + json.dumps(fig.get('data', []), cls=PlotlyJSONEncoder, sort_keys=True)
+            + ', "layout": ' + json.dumps(fig.get('layout', {}), cls=PlotlyJSONEncoder, sort_keys=True)
+            + ', "config": {"responsive": true}}')
+        with open(data_file, 'w') as file:
+            file.write(spec)
+        with open(figfile, 'w') as file:
+            file.write('<div class="figure_wrap_plotly"><div id="' + str(uuid.uuid4())
+                + '" class="plotly-graph-div plotly-lazy" style="height:100%; width:100%;" data-src="'
+                + html.escape(data_url) + '"></div></div>')
+        return [figfile, data_file]
+    # render figure
+    chunk = pio.to_html(
+        fig,
+        validate=False, # built by plotly
+        default_height='100%',
+        default_width='100%',
+        full_html=False,
+        include_plotlyjs=False # handled via pandoc to be included once
+    )
+    def sub(m):
+        if m.group(1):
+            return '<div class="figure_wrap_plotly">'
+        return m.group(2) or m.group(3)
+    # write once
+    with open(figfile,'w') as file:
+        file.write(chunk_regex.sub(sub, chunk))
+    return [figfile]
+
+
+################################################################################
+###  UNDESA DATA  ##############################################################
+################################################################################
+
+undesa_sheets = {
+    'total': {'tot': dict(sheet_name='Table 3', usecols='B:L')},
+    'od': {s: dict(sheet_name='Table '+ str(i), nrows=1992, index_col=None, header=[15])
+        for i, s in enumerate(['TOTAL','F','M'],1)}
+}
+
+# European destination countries
+undesa_destinations = ['Austria', 'Belgium', 'Croatia', 'Czechia', 'Denmark', 'Estonia',
+    'Finland', 'France', 'Germany', 'Greece', 'Hungary', 'Iceland',
+    'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
+    'Montenegro', 'North Macedonia', 'Netherlands', 'Norway', 'Poland',
+    'Portugal', 'Romania', 'Serbia', 'Slovakia', 'Slovenia', 'Spain',
+    'Sweden', 'Switzerland', 'United Kingdom']
+
+
+def undesa_origin_groups(origins):
+    # origin countries grouping
+    # distinction is made between EU and non-EU countries, but could also be Europe/non-Europe
+    orig_eu = ['Austria', 'Belgium', 'Bulgaria', 'Croatia', 'Cyprus', 'Czechia',
+        'Denmark', 'Estonia', 'Finland', 'France', 'Germany', 'Greece', 'Hungary',
+        'Ireland', 'Italy', 'Latvia', 'Lithuania', 'Luxembourg', 'Malta',
+        'Netherlands', 'Poland', 'Portugal', 'Romania', 'Slovakia', 'Slovenia',
+        'Spain', 'Sweden', 'United Kingdom']
+    # Other North: unknown if EU or TC; Other South: TC
+    return {'EU': orig_eu, 'Non-EU': [o for o in origins if o not in orig_eu and o != 'Other North']}
+
+###  FETCH & RECODE  ###########################################################
+
+def recode_undesa(tot_file, od_file, baseyear, rawdir, store):
+    '''
+    Recode the fetched UNDESA workbooks (paths, None if unavailable). In case
+    the data is unavailable, a local copy in `rawdir` is loaded.
+    Returns df_undesa and the year of the data.
+    '''
+
+    #
+    # (1) total population share of immigrants across countries
+    #
+
+    try: # fetch from web
+        df_tot = ingest.read_workbook(tot_file, undesa_sheets['total'], store,
+            'UN_MigrantStockTotal_' + str(baseyear))['tot']
+    except: # fetch local copy (2019)
+        df_tot = ingest.read_workbook(rawdir + 'UN_MigrantStockTotal_2019.xlsx',
+            undesa_sheets['total'], store)['tot']
+        baseyear = 2019
+
+    df_tot = df_tot.iloc[0:298, [0,10]] # caution: original index maintained
+    df_tot['sex'] = 'TOTAL'
+    df_tot.columns = ['country', 'popshare_tot', 'sex']
+
+    #
+    # (2) total immigrant population by gender and origin groups (EU/TC)
+    #
+
+    try: # fetch from web
+        od = ingest.read_workbook(od_file, undesa_sheets['od'], store,
+            'UN_MigrantStockByOriginAndDestination_' + str(baseyear))
+    except: # fetch local copy (2019)
+        od = ingest.read_workbook(rawdir + 'UN_MigrantStockByOriginAndDestination_2019.xlsx',
+            undesa_sheets['od'], store)
+        baseyear = 2019
+
+    tensor = stocks.Stocks.from_sheets({s: od[s] for s in ['TOTAL','F','M']},
+        undesa_destinations, range(2019225,2019278)) # European destination countries
+
+    # origin groups (EU/TC) and top 5 origin countries by sex and destination
+    groups = undesa_origin_groups(tensor.origins)
+    agg = tensor.aggregate(groups)
+    top_pos, top_pop = tensor.top(5, exclude=['Other South']) # TC
+    origins = np.array(tensor.origins + [None], dtype=object) # -1: no origin
+    origins[tensor.index['origin']['Other North']] = 'Unknown' # Unknown if EU or TC
+
+    # rows per sex and destination: top 5 by rank, total and origin groups
+    naggs = 1 + len(groups)
+    shape = top_pos.shape[:2] + (top_pos.shape[2] + naggs,)
+    c_birth = np.concatenate([origins[top_pos],
+        np.broadcast_to(np.array(['Total'] + list(groups), dtype=object), shape[:2] + (naggs,))], axis=2)
+    pop = np.concatenate([top_pop, tensor.total[..., None], agg], axis=2)
+    rank = np.append(np.arange(1, top_pos.shape[2] + 1), np.full(naggs, np.nan))
+    keep = np.concatenate([top_pos >= 0, np.ones(shape[:2] + (naggs,), dtype=bool)], axis=2)
+    keep &= tensor.present[..., None]
+
+    # stacked by sex, destinations in alphabetical order
+    order = np.argsort(np.array(tensor.destinations, dtype=object), kind='stable')
+    def rows(a):
+        return np.broadcast_to(a, shape)[:, order][keep[:, order]]
+    df_undesa = pd.DataFrame({
+        'year': rows(tensor.year[..., None]),
+        'country': rows(np.array(tensor.destinations, dtype=object)[:, None]),
+        'popshare_for': rows(tensor.total[..., None]),
+        'c_birth': rows(c_birth),
+        'pop': rows(pop),
+        'orig_rank': rows(rank),
+        'sex': rows(np.array(tensor.sexes, dtype=object)[:, None, None]),
+    })
+    df_undesa['popshare_for'] = df_undesa['pop'].divide(df_undesa['popshare_for'], fill_value=0)
+
+    # merge with total pop share data
+    df_undesa = df_undesa.merge(df_tot, on=['country','sex'], how='left')
+
+    return df_undesa, baseyear
+
+
+###  PLOT  #####################################################################
+
+def undesa_plot_frame(df_undesa):
+
+    df_undesa = df_undesa.copy()
+
+    # label countries and add groups (categoricals for sorting and faceting)
+    dim = countries.dimension(df_undesa['country'].unique()).rename(
+        columns={'code': 'country', 'label': 'country_label', 'group': 'country_group'})
+    index = df_undesa.index
+    df_undesa = df_undesa.merge(dim[['country', 'country_label', 'country_group']], on='country', how='left')
+    df_undesa.index = index
+    df_undesa['country'] = df_undesa.pop('country_label')
+
+    return df_undesa
+
+
+def fig_imgpop(df_undesa):
+    '''
+    (1) Stacked bar chart with immigrant population by country, origin group,
+    gender and immigrant share of total population (y axis 2)
+    '''
+
+    # Create figure with secondary y-axis
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+
+    df_plot = df_undesa[
+        (df_undesa['c_birth'].isin(['EU','Non-EU', 'Unknown'])) & (df_undesa['sex']!='TOTAL')
+    ]
+
+    # add every trace manually and then stack
+    namelist = ['Women', 'Men']
+    k = 0
+    colorlist = ['rgba(0,119,187,0.5)', 'rgba(136,204,238,0.5)', 'rgba(136,34,85,0.5)',
+        'rgba(204,102,119,0.5)', 'rgba(120,120,120,0.5)', 'rgba(180,180,180,0.5)']
+    idx = traces.PartitionIndex(df_plot, ['c_birth', 'sex'])
+    for i, cb in enumerate(df_plot['c_birth'].unique()):
+        for j, s in enumerate(df_plot['sex'].unique()):
+
+            df_subplot = idx.get(cb, s)
+
+            fig.add_trace(
+                go.Bar(
+                    name = cb + ' origin, ' + namelist[j],
+                    x = df_subplot['country'],
+                    y = df_subplot['pop'],
+                    hovertemplate = '<b>%{x}</b><br>Origin: ' + cb + '<br>Gender: ' + namelist[j] + '<br>Population: %{y:.3s}<extra></extra>',
+                    marker_color = colorlist[k],
+                    marker_line_width=0
+                ),
+                secondary_y=False,
+            )
+
+            k += 1
+
+    # sort by destination country group, descending within
+    sortlist = df_undesa[df_undesa['c_birth']=='Total'].sort_values(by=['country_group','pop'], ascending=[True, False], axis=0)
+    sortlist = sortlist['country'].unique()
+
+    # update layout
+    fig.update_layout(
+        #title = '<b>Nativity and gender gaps in ' + vlbl + ' rates,' + plotyear + '</b>',
+        legend_title_text = '<b> Origin and gender </b>',
+        xaxis_title = 'Country',
+        yaxis_title = 'Immigrant population (in millions)',
+        barmode='stack',
+        bargap=0.4,
+        xaxis= dict(tickangle = -45,
+            categoryorder = 'array',
+            categoryarray = sortlist,
+        ),
+        xaxis_type='category',
+        legend = dict(traceorder='reversed', x = 0.92, xanchor = 'right', y = 0.95),
+        margin = dict(t = 30, b = 80, l = 0, r = 0)
+    )
+    fig.for_each_trace(
+        lambda t: t.update(marker_color=t.marker.color.replace('0.5','0.8'))
+    )
+
+    # add separators between origin groups
+    fig.add_vline(x = 13.5, line_color='rgba(0, 0, 0, 1)', line_dash='dash', line_width=1)
+    fig.add_vline(x = 18.5, line_color='rgba(0, 0, 0, 1)', line_dash='dash', line_width=1)
+
+    # Add scatter with immigrant total pop share
+    df_plot = df_undesa[
+        (df_undesa['c_birth']=='Total') & (df_undesa['sex']=='TOTAL')
+    ]
+    fig.add_trace(
+        go.Scatter(
+            x = df_plot['country'],
+            y = df_plot['popshare_tot'],
+            mode = 'markers',
+            marker_symbol = 'diamond',
+            marker_color = 'rgba(255, 255, 255, 1)',
+            marker_line_color = 'rgba(37, 37, 37, 1)',
+            marker_line_width = 1,
+            showlegend = True,
+            name = 'Share of total population',
+            hovertemplate = '<b>%{x}</b><br>Share (%): %{y:.1f}<extra></extra>',
+        ),
+        secondary_y=True,
+    )
+    fig.update_yaxes(title_text="Immigrant share of total population (%)", range=[0, 50], tick0=0, dtick=10, secondary_y=True)
+    fig.update_yaxes(range=[0,15000000], dtick=3000000, secondary_y=False)
+
+    return fig
+
+
+def fig_imgpop_top5(df_undesa):
+    '''
+    (2) Shares of top 5 origins relative to immigrant population in 2019 by gender
+
+    Interactive: User can select country.
+    '''
+
+    df_plot = df_undesa[
+        (df_undesa['sex']!='TOTAL') & (df_undesa['orig_rank'].notnull())
+    ]
+
+    # start with empty facet plot
+    fig = make_subplots(
+        rows=1, cols=2, subplot_titles=("Women", "Men"), shared_yaxes=False,
+        horizontal_spacing=0.05
+    )
+
+    # info, selector
+    glist = ['Women', 'Men']
+    btn1 = []
+
+    # add country traces: base trace is Austria, fetch all if data available
+    idx = traces.PartitionIndex(df_plot, ['country', 'sex'],
+        columns=['country', 'sex','c_birth','popshare_for'])
+    clist = df_plot['country'].unique()
+    for c in clist:
+
+        xdata = []
+        ydata = []
+        customdata = []
+
+        if pd.isnull(df_plot['popshare_for']).all():
+            print(c + ' has no values to plot. Excluded from figure.')
+        else:
+            # create figure by reliability subgroup to avoid additional legend grouping
+            for j, s in enumerate(df_plot['sex'].unique()):
+                df_subplot = idx.get(c, s).sort_values('popshare_for', ascending=False)
+
+                if c=='Austria':
+                    # add traces manually for first country
+                    trace = go.Bar(
+                        x = df_subplot['popshare_for'],
+                        y = df_subplot['c_birth'],
+                        marker_color = ptheme.colors_paired_transp[j*2],
+                        marker_line_width=0,
+                        visible = True,
+                        showlegend = False,
+                        orientation='h',
+                        text=df_subplot['c_birth'],
+                        textposition='auto',
+                        customdata = df_subplot['country'],
+                        hovertemplate = '<b>%{customdata}</b><br>Gender: ' + glist[j] + '<br>Origin: %{y}<br>Share among immigrants: %{x:.1%}<extra></extra>',
+                    )
+                    fig.add_trace(trace, row=1, col=j+1)
+                # store associated data for buttons
+                xdata.append(df_subplot['popshare_for'])
+                ydata.append(df_subplot['c_birth'])
+                customdata.append(df_subplot['country'])
+            # add to button dict
+            # update only traces associated with each button
+            btn1.append(dict(
+                    method = "restyle",
+                    args = [{'x': xdata, 'y': ydata, 'visible': True, 'showlegend': False, 'text': ydata, 'customdata': customdata}],
+                    label = c)
+            )
+    # style
+    fig.update_layout(
+        yaxis_title = '5 largest origin groups',
+        bargap=0.4,
+        margin = dict(t = 30, b = 70, l = 0, r = 0),
+    )
+    fig.for_each_trace(
+        # make outlines opaque
+        lambda t: t.update(marker_color=t.marker.color.replace('0.5','0.8'))
+    )
+    fig.for_each_annotation(
+        # keep only labels as facet titles
+        lambda a: a.update(text=a.text.split("=")[-1])
+    )
+
+    # Single label for y and x
+    fig.update_xaxes(showticklabels=True, dtick=0.1, tickformat='.0%', title='')
+    fig.update_yaxes(showticklabels=False, ticks='')
+
+    # add centered x axis label
+    fig.add_annotation(text='Share among immigrant population', font=dict(size=14),
+        xanchor='center', xref='paper', x=0.5, yanchor='top', yref='paper', y=-0.1, showarrow=False)
+
+    # add button for country selection
+    fig.update_layout(
+        updatemenus=[
+            dict(active=0,
+                buttons=btn1,
+                xanchor = 'left',
+                x = 1.025,
+                yanchor = 'top',
+                y = 1,
+                bgcolor = '#fff',
+                bordercolor = '#000',
+                borderwidth = 2,
+                pad = dict(r=4))
+      ]
+    )
+
+    return fig
+
+
+################################################################################
+###  EUROSTAT DATA  ############################################################
+################################################################################
+
+###  FETCH & RECODE  ###########################################################
+
+def read_indicator(vname):
+    # only the rows used of the Eurostat table (streamed, see bulk.py)
+    indicator = sources.indicators[vname]
+    return bulk.read(sources.eurostat_urls()[vname], indicator.keep, indicator.drop)
+
+
+def recode_indicator(df, vname):
+    '''
+    Recode one Eurostat table as read by read_indicator() or fetched by
+    `es.get_data_df(table, True)`: select, add the gaps (by country, c_birth
+    and sex) and return the long format of panel.py.
+
+    How the table is laid out is given by its spec in sources.indicators:
+    most tables have one row per (c_birth, sex, country) and one value and
+    flag column per year, overq has one row per (mgstatus, sex) and one value
+    and flag column per country (2014 only). The cells are placed in one
+    (country, year, c_birth, sex) array, without reshaping the frame.
+    '''
+
+    # selection (a no-op on tables from read_indicator())
+    indicator = sources.indicators[vname]
+    mask = np.ones(len(df), dtype=bool)
+    for dim, codes in indicator.keep.items():
+        mask &= df[dim].isin(codes).to_numpy()
+    for dim, codes in indicator.drop.items():
+        mask &= ~df[dim].isin(codes).to_numpy()
+    df = df[mask]
+
+    cols1 = [col for col in df.columns if col.endswith('_value')]
+    cols2 = [col for col in df.columns if col.endswith('_flag')]
+    # labels of the rows and of the value columns
+    rows = {axis: df[dim].astype(object).replace(indicator.codes) for axis, dim in indicator.rows.items()}
+    if indicator.year is not None:
+        rows['year'] = np.full(len(df), str(indicator.year))
+    columns = {indicator.columns: [c[:-len('_value')] for c in cols1]}
+    cblist = indicator.groups
+
+    # label of every cell (row-major) and its position on each axis
+    value = df[cols1].to_numpy(dtype=float).ravel()
+    flag = df[cols2].to_numpy().ravel()
+    if flag.dtype != flags.dtype: # flag strings of es.get_data_df
+        flag = flags.encode(flag)
+    cells = {k: np.repeat(np.asarray(v, dtype=object), len(cols1)) for k, v in rows.items()}
+    cells.update({k: np.tile(np.asarray(v, dtype=object), len(df)) for k, v in columns.items()})
+    axes = {
+        'country': sorted(set(cells['country'])),
+        'year': sorted(set(cells['year'])),
+        'c_birth': sorted(['NAT'] + cblist),
+        'sex': ['F', 'M'],
+    }
+    pos = tuple(pd.Index(labels).get_indexer(cells[k]) for k, labels in axes.items())
+    shape = tuple(len(labels) for labels in axes.values())
+    if len(np.unique(np.ravel_multi_index(pos, shape))) < len(value):
+        raise ValueError(vname + ': duplicate cells')
+
+    # calculate gaps and add as constant per gender, add flags of both cells
+    # (all contrasts and origin groups at once, see gaps.py)
+    measures = sorted(['avg'] + list(gaps.contrasts))
+    mpos = np.array([measures.index(m) for m in gaps.contrasts])[:, None]
+    gpos = np.array([axes['c_birth'].index(cb) for cb in cblist])[None, :]
+    values = np.full(shape[:2] + (len(measures),) + shape[2:], np.nan) # (country, year, measure, c_birth, sex)
+    masks = np.full(values.shape, flags.MISSING, dtype=flags.dtype)
+    values[:, :, measures.index('avg')][pos] = value
+    masks[:, :, measures.index('avg')][pos] = flag
+    gap, gap_flag = gaps.gaps(values[:, :, measures.index('avg')], axes['c_birth'], axes['sex'], cblist,
+        flags=masks[:, :, measures.index('avg')])
+    values[:, :, mpos, gpos] = gap
+    masks[:, :, mpos, gpos] = gap_flag
+
+    axes['measure'] = measures
+    order = (0, 1, 3, 4, 2) # measure last
+    return panel.tidy(vname, axes, values.transpose(order), masks.transpose(order))
+
+
+
+###  PLOT  #####################################################################
+
+def eurostat_cube(df_eurostat, country_dim):
+    '''
+    Cube of the Eurostat panel for the figures (see cube.py), in plot order:
+    countries with a label by label (then code), years, c_birth as ordered in
+    the figures, sex and measure. Countries without label are left out.
+    '''
+    dim = country_dim.dropna(subset=['label'])
+    dim = dim[dim['code'].isin(df_eurostat['country'].cat.categories)]
+    dim = dim.assign(code=dim['code'].astype(str)).sort_values(['label', 'code'], kind='mergesort')
+    years = sorted(df_eurostat['year'].cat.categories, key=int)
+    axes = {
+        'indicator': list(df_eurostat['var'].cat.categories),
+        'country': list(dim['code']),
+        'year': ([int(y) for y in years], years),
+        'c_birth': ['NAT', 'FOR', 'EU28_FOR', 'NEU28_FOR'],
+        'sex': sorted(df_eurostat['sex'].cat.categories),
+        'measure': sorted(df_eurostat['measure'].cat.categories),
+    }
+    attrs = {'country': {'country_label': dim['label'].array, 'country_group': dim['group'].array}}
+    return cube.Cube.from_panel(df_eurostat, axes, attrs)
+
+
+def eurostat_plot_frame(cube, vname, **labels):
+    # labelled rows of one outcome for the plots (selected by label, see Cube.take)
+
+    sub = cube.take(indicator=vname, **labels)
+    df = sub.frame().drop(columns='indicator')
+    df = df.rename(columns={'flag': 'reliability'})
+    df['reliability'] = np.where(flags.has(df['reliability'], 'u'), 'Low', 'Ok')
+    c = pd.Categorical(df['reliability'], categories=['Ok', 'Low'], ordered=True)
+    df['reliability'] = c.astype('category')
+
+    # make origin categorical to allow ordering and label
+    c = pd.Categorical(df['c_birth'],
+        categories=['NAT', 'FOR', 'EU28_FOR', 'NEU28_FOR'], ordered=True)
+    c = c.rename_categories({'NAT': 'Nat', 'FOR': 'For', 'EU28_FOR': 'EU', 'NEU28_FOR': 'TC'})
+    df['c_birth'] = c.astype('category')
+
+    # make measure categorical to allow ordering in plot
+    c = pd.Categorical(df['measure'], categories=['iwnw', 'iwim', 'iwnm'], ordered=True)
+    df['measure_cat'] = c.astype('category')
+
+    # rows are in plot order (see eurostat_cube), unless several codes share a
+    # label: then their rows are sorted by year within the label
+    if len(set(sub.attrs['country']['country_label'])) < len(sub.axes['country']):
+        df = df.sort_values(by=['country_label', 'year', 'c_birth'], axis=0).reset_index(drop=True)
+    df['year'] = df['year'].astype('int32')
+
+    return df[['country', 'year', 'c_birth', 'sex', 'measure', 'value', 'reliability',
+        'country_label', 'country_group', 'measure_cat']]
+
+
+def fig_dd(cube, vname, vlbl, plotyear):
+    '''
+    (1) plot gaps for 2019 (2014) in one plot per outcome
+    '''
+
+    fig = go.Figure()
+
+    df_plot = eurostat_plot_frame(cube, vname, measure=[m for m in cube.axes['measure'] if m != 'avg'],
+        year=plotyear, sex='F', c_birth='FOR')
+
+    # add every trace manually
+    # create figure by reliability subgroup to avoid additional legend grouping
+    markerlist = ['diamond', 'x', 'circle']
+    labelDict = {'iwnw': 'Native women', 'iwim': 'Immigrant men', 'iwnm': 'Native men'}
+    legendShowDict = {'Ok': True, 'Low': False}
+    idx = traces.PartitionIndex(df_plot, ['reliability', 'measure_cat'])
+    for i, rel in enumerate(df_plot['reliability'].unique()):
+        for j, mcat in enumerate(df_plot['measure_cat'].unique()):
+            # to reserve the space all unused values to missing instead of subsetting
+            fig.add_trace(
+                go.Scatter(
+                    x = df_plot['country_label'],
+                    y = df_plot['value'].where(idx.mask(rel, mcat)),
+                    mode = 'markers',
+                    marker_symbol = markerlist[j],
+                    marker_color = ptheme.colors_paired_transp[i+j*2],
+                    legendgroup = mcat,
+                    showlegend = legendShowDict[rel],
+                    name = labelDict[mcat],
+                    hovertemplate = '<b>%{x}</b><br>Gap (pp.): %{y}<br>Immigrant women<br>vs. ' + labelDict[mcat] + '<extra></extra>',
+                )
+            )
+    fig.add_hline(y=0, line_color='rgba(0, 0, 0, 1)', line_width=1)
+    fig.add_vline(
+        x = 13.5 if vname!= 'overq' else 9.5,
+        line_color='rgba(0, 0, 0, 1)', line_dash='dash', line_width=1)
+    fig.add_vline(
+        x = 18.5 if vname!= 'overq' else 14.5,
+        line_color='rgba(0, 0, 0, 1)', line_dash='dash', line_width=1)
+    fig.update_layout(
+        #title = '<b>Nativity and gender gaps in ' + vlbl + ' rates,' + plotyear + '</b>',
+        legend_title_text = '<b> Immigrant women vs. </b>',
+        xaxis_title = 'Country',
+        yaxis_title = 'Gap in ' + vlbl + ' rates (pp)',
+        xaxis = dict(tickangle = -45),
+        legend = dict(traceorder='reversed',
+            x = 0.015 if vname != 'pt' else 0.985,
+            xanchor = 'left' if vname != 'pt' else 'right',
+            y = 0.97),
+        margin = dict(t = 30, b = 80, l = 0, r = 0)
+    )
+    fig.for_each_trace(
+        lambda t: t.update(marker_line_color=t.marker.color.replace('0.5','1'), marker_line_width=1.5, marker_size=9)
+    )
+
+    return fig
+
+
+def fig_abs(cube, vname, vlbl, plotyear):
+    '''
+    (2) plot absolute values for 2019 (2014) by origin, one plot per country
+    '''
+
+    plotfacetcols = 4 if (vname == 'overq') else 3
+
+    # subset to absolute values
+    df_plot = eurostat_plot_frame(cube, vname, measure='avg', year=plotyear)
+    # start with facet plot
+    fig = px.scatter(df_plot, x='c_birth', y='value', color='reliability', symbol='sex',
+                facet_col='country_label', facet_col_wrap=plotfacetcols,
+                facet_row_spacing=0.035, # default is 0.07 when facet_col_wrap is used
+                facet_col_spacing=0.08, # default is 0.03
+                hover_data=['reliability', 'sex']
+    )
+    fig.update_traces(
+        hovertemplate = 'Region of birth: %{x}<br>Gender: %{customdata[1]}<br>Value: %{y}<br>Reliability:  %{customdata[0]}<extra></extra>'
+    )
+    fig.update_layout(
+        # title = '<b>' + vlbl.capitalize() + ' rates by gender and origin group,' + plotyear + '</b>',
+        margin = dict(t = 30, b = 40, l = 75, r = 5),
+        legend_title_text = '<b> Gender: </b>',
+        legend = dict(
+            xanchor = 'right',
+            x = 1,
+            yanchor = 'bottom',
+            y = 0,
+            orientation = 'v',
+            valign = 'bottom',
+        ),
+    )
+    fig.for_each_trace(
+        # make outlines opaque
+        lambda t: t.update(
+            marker_color = ptheme.colors_paired_transp[1] if 'Low' in t.legendgroup else t.marker.color,
+            marker_line_color=t.marker.color.replace('0.5','1'),
+            marker_line_width=1.5,
+            marker_size=6,
+            showlegend = False if 'Low' in t.legendgroup else t.showlegend,
+            name = 'Women' if 'F' in t.legendgroup else 'Men',
+            legendgroup = 'F' if 'F' in t.legendgroup else 'M'
+            )
+    )
+    fig.for_each_annotation(
+        # keep only labels as facet titles
+        lambda a: a.update(text=a.text.split("=")[-1])
+    )
+    # Single label for y and x
+    fig.update_xaxes(showticklabels=True, title='')
+    fig.add_annotation(
+        text = 'Region of birth', align = 'center',
+        xref = 'paper', yref = 'paper', xanchor = 'center', yanchor='bottom',
+        x = 0.5, y=-0.04, showarrow=False, font=dict(size=14)
+    )
+    fig.update_yaxes(showticklabels=True, title='', dtick=20, tick0=0)
+    fig.add_annotation(
+        text = vlbl.capitalize() + ' rate (in percent)', align = 'center',
+        xref = 'paper', yref = 'paper', xanchor = 'right', yanchor='middle',
+        x = -0.055, y=0.5, showarrow=False, textangle=-90, font=dict(size=14)
+    )
+
+    return fig
+
+
+def fig_dd_trend(cube, vname, vlbl, baseyear):
+    '''
+    (3) plot trends in gaps by origin over time, one plot per country
+
+    To be fun to use, the user should be able to choose two of the countries
+    to compare them.
+    '''
+
+    df_plot = eurostat_plot_frame(cube, vname, measure=[m for m in cube.axes['measure'] if m != 'avg'],
+        sex='F', c_birth=[c for c in cube.axes['c_birth'] if c != 'NAT'],
+        year=[y for y in cube.axes['year'] if y in range(1995, baseyear+1)])
+
+    # start with empty facet plot
+    dummy_df = pd.DataFrame({
+        'Year': [2000,2000,2000], 'y': [0,0,0],
+        'c_birth': ['Foreign born', 'EU born', 'Non-EU born (TC)']
+    })
+    # caution: order is somehow reversed via the express function (decrement in loop!)
+    fig = px.scatter(dummy_df, x='Year', y='y', facet_row='c_birth', facet_row_spacing=0.1)
+    fig.data = [] # only layout needed
+    # fig.update_traces(showlegend=False, visible=False)
+
+    # styling/functionality items
+    markerlist = ['diamond', 'x', 'circle']
+    linelist = ['dash', 'dot', 'solid']
+    labelDict = {'iwnw': 'Native women', 'iwim': 'Immigrant men', 'iwnm': 'Native men'}
+    legendvis = [True, False, False, False, False, False] * 3
+    btn1 = []
+    btn2 = []
+
+    # add country traces: base trace is Austria, fetch all if data available
+    idx = traces.PartitionIndex(df_plot, ['country_label', 'measure_cat', 'reliability', 'c_birth'],
+        columns=['country_label', 'year','value','c_birth'])
+    clist = df_plot['country_label'].unique()
+    for c in clist:
+
+        xdata = []
+        ydata = []
+        hoverdata = []
+
+        if pd.isnull(df_plot['value']).all():
+            print(c + ' has no values to plot. Excluded from figure.')
+        else:
+            # create figure by reliability subgroup to avoid additional legend grouping
+            for j, mcat in enumerate(df_plot['measure_cat'].unique()):
+                for i, rel in enumerate(df_plot['reliability'].unique()):
+                    for k, bcat in enumerate(df_plot['c_birth'].unique()):
+                        df_subplot = idx.get(c, mcat, rel, bcat)
+                        if c=='Austria':
+                            # add traces manually for first country
+                            trace = go.Scatter(
+                                x = df_subplot['year'],
+                                y = df_subplot['value'],
+                                mode = 'lines+markers',
+                                marker_symbol = markerlist[j],
+                                marker_color = ptheme.colors_paired_transp[i],
+                                line_color = ptheme.colors_paired_transp[i],
+                                line_width = 2,
+                                line_dash = linelist[j],
+                                connectgaps = True,
+                                visible = True,
+                                legendgroup = mcat,
+                                showlegend = True if (i==0 and k==0) else False, # show only first set
+                                name = labelDict[mcat],
+                                text = df_subplot['country_label'],
+                                hovertemplate = '<b>%{text}</b><br>Year: %{x}<br>Gap (pp.): %{y}<br>Immigrant women<br>vs. ' + labelDict[mcat] + '<extra></extra>',
+                            )
+                            fig.add_trace(trace, row=3-k, col=1)
+                            # add traces one by one (second set)
+                            trace = go.Scatter(
+                                x = df_subplot['year'],
+                                y = df_subplot['value'],
+                                mode = 'lines+markers',
+                                marker_symbol = markerlist[j],
+                                marker_color = ptheme.colors_paired_transp[i+2],
+                                line_color = ptheme.colors_paired_transp[i+2],
+                                line_width = 2,
+                                line_dash = linelist[j],
+                                connectgaps=True,
+                                visible = False,
+                                legendgroup = mcat,
+                                showlegend = False,
+                                name = labelDict[mcat],
+                                text = df_subplot['country_label'],
+                                hovertemplate = '<b>%{text}</b><br>Year: %{x}<br>Gap (pp.): %{y}<br>Immigrant women<br>vs. ' + labelDict[mcat] + '<extra></extra>',
+                            )
+                            fig.add_trace(trace, row=3-k, col=1)
+                        # store associated data for buttons
+                        xdata.append(df_subplot['year'])
+                        ydata.append(df_subplot['value'])
+                        hoverdata.append(df_subplot['country_label'])
+            # add to button dict
+            # update only traces associated with each button
+            btn1.append(dict(
+                    method = "restyle",
+                    args = [{'x': xdata, 'y': ydata, 'visible': True, 'showlegend': legendvis, 'text': hoverdata}, np.arange(0,len(xdata)*2,2)],
+                    label = c)
+            )
+            btn2.append(dict(
+                    method = "restyle",
+                    args = [{'x': xdata, 'y': ydata, 'visible': True, 'showlegend': legendvis, 'text': hoverdata}, np.arange(1,len(xdata)*2,2)],
+                    label = c)
+            )
+    # style
+    fig.update_layout(
+        # title = '<b>Trend in nativity and gender gaps in ' + vlbl + ' by origin group</b>',
+        xaxis_title = 'Year',
+        legend_title_text = '<b> Immigrant women vs. </b>',
+        margin = dict(t = 30, b = 50, l = 0, r = 0),
+        legend = dict(
+            xanchor = 'left',
+            x = 1.045,
+            yanchor = 'middle',
+            y = 0.5,
+            orientation = 'v',
+            valign = 'middle',
+        ),
+    )
+    fig.for_each_trace(
+        # make outlines opaque
+        lambda t: t.update(marker_line_color=t.marker.color.replace('0.5','1'), marker_line_width=1, marker_size=6)
+    )
+    fig.for_each_annotation(
+        # keep only labels as facet titles
+        lambda a: a.update(text=a.text.split("=")[-1])
+    )
+    # Single label for y and x
+    fig.update_xaxes(showticklabels=True, dtick=5)
+    fig.layout.yaxis['title']=''
+    fig.layout.yaxis2['title'] = 'Gap in ' + vlbl + ' rates (pp)'
+    fig.layout.yaxis3['title']=''
+    fig.update_yaxes(showticklabels=True)
+    # zero line
+    fig.add_hline(y=0, line_color='rgba(0, 0, 0, 1)', line_width=1)
+    # add buttons for country selection
+    # Button 1 always active with Austria preselected
+    # Button 2 is disabled but allows selection of second country
+    btn2.insert(0, dict(
+            method = "restyle",
+            args = [{'x': [0], 'y': [0], 'visible': False, 'showlegend': False}, np.arange(1,len(xdata)*2,2)],
+            label = 'Compare to...'
+        )
+    )
+    fig.update_layout(
+        updatemenus=[
+            dict(active=0,
+                buttons=btn1,
+                xanchor = 'left',
+                x = 1.045,
+                yanchor = 'top',
+                y = 1,
+                bgcolor = '#fff',
+                bordercolor = '#000',
+                borderwidth = 2),
+           dict(buttons=btn2,
+                xanchor = 'left',
+                x = 1.045,
+                yanchor = 'top',
+                y = 0.9,
+                bgcolor = '#fff',
+                bordercolor = '#000',
+                borderwidth = 2)
+      ]
+    )
+
+    return fig
+
+
+################################################################################
+###  PROCESSED DATA  ###########################################################
+################################################################################
+'''
+Processed data is kept as Parquet datasets (see dataset.py), partitioned by
+year and, for Eurostat, by indicator.
+'''
+
+def write_undesa(df_undesa, root):
+    # one partition per year, other years are kept
+    return dataset.write(df_undesa, root, ['year'], partitions=True)
+
+
+def write_eurostat(df_eurostat, root):
+    return dataset.write(df_eurostat, root, ['var', 'year'], panel.keys)
+
+
+def migrate_pickles(processed):
+    # processed data was kept as pickles (undesa.pkl, eurostat.pkl) before
+    processed = Path(processed)
+    for name, write, convert in [
+            ('undesa', write_undesa, None),
+            ('eurostat', write_eurostat, lambda df: df if 'var' in df.columns else panel.from_wide(df))]:
+        pkl = processed / (name + '.pkl')
+        if pkl.exists() and not dataset.exists(processed / name):
+            df = pd.read_pickle(pkl)
+            write(df if convert is None else convert(df), processed / name)
+            print('Migrated ' + str(pkl) + ' to ' + str(processed / name))
+
+
+################################################################################
+###  SOURCES & FIGURES  ########################################################
+################################################################################
+'''
+Lazy, memoized access to the data and figures, e.g. in a notebook:
+
+    undesa = UndesaSource(2019, cache)
+    eurostat = EurostatPanel(2019)
+    figs = Figures(undesa, eurostat)
+    figs.figure('dd_2019_lfp').show()
+
+Nothing is fetched or recoded before it is needed: the call above only recodes
+the Eurostat `lfp` table and builds that one figure. Results are kept on the
+objects, so asking again (or for `abs_2019_lfp`) reuses them.
+'''
+
+class UndesaSource:
+    '''
+    UNDESA migrant stocks for `baseyear`. Workbooks are fetched through
+    `cache` (a DownloadCache); without cache or if the download fails, the
+    local copies in `rawdir` are used (2019).
+    '''
+
+    def __init__(self, baseyear=2019, cache=None, rawdir='data/raw/', store='data/temp/undesa'):
+        self.baseyear = baseyear
+        self.cache = cache
+        self.rawdir = rawdir
+        self.store = store
+        self._data = None
+        self._frame = None
+
+    def files(self):
+        files = {}
+        for name, url in sources.undesa_urls(self.baseyear).items():
+            try:
+                files[name] = self.cache.fetch(url) if self.cache is not None else None
+            except Exception:
+                files[name] = None
+        return files
+
+    def load(self, df_undesa, year):
+        # use data recoded earlier (e.g. by a previous build)
+        self._data = (df_undesa, year)
+        self._frame = None
+
+    @property
+    def data(self):
+        if self._data is None:
+            files = self.files()
+            self._data = recode_undesa(files['undesa_tot'], files['undesa_od'],
+                self.baseyear, self.rawdir, self.store)
+        return self._data[0]
+
+    @property
+    def year(self):
+        # year of the data (2019 if the local copy was used)
+        self.data
+        return self._data[1]
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = undesa_plot_frame(self.data)
+        return self._frame
+
+
+class EurostatPanel:
+    '''
+    Eurostat labor market indicators (see sources.indicators), recoded
+    one table at a time on first access. If the table of an indicator cannot
+    be fetched, its processed 2019 data is read from the dataset `processed`;
+    the other indicators are not affected.
+
+    The data covers all years; `baseyear` only sets the year plotted. Panels
+    for other base years made with at() share the data (and plot frames), so
+    the tables are recoded once for any number of base years.
+    '''
+
+    def __init__(self, baseyear=2019, processed='data/processed/eurostat'):
+        self.baseyear = baseyear
+        self.processed = processed
+        self.fallback = set() # indicators taken from `processed`
+        self._data = {}
+        self._cube = {} # cube for the figures (shared with views of at())
+        self._dims = {} # geo labels and country dimension
+
+    def at(self, baseyear):
+        # the same panel (shared data) for another base year
+        view = copy.copy(self)
+        view.baseyear = baseyear
+        return view
+
+    def load(self, vname, df, fallback=False):
+        # use data recoded earlier (e.g. by a previous build)
+        self._data[vname] = df
+        self._cube.clear()
+        if fallback:
+            self.fallback.add(vname)
+        else:
+            self.fallback.discard(vname)
+
+    # a table that cannot be fetched: not cached while offline, network
+    # errors (URLError and HTTPError are OSErrors), truncated or missing files;
+    # errors of the recode itself are raised
+    unavailable = (CacheMiss, OSError, EOFError)
+
+    def indicator(self, vname):
+        if vname not in self._data:
+            try: # try recode with directly fetched data
+                self._data[vname] = recode_indicator(read_indicator(vname), vname)
+            except self.unavailable: # if the table is unavailable, use processed 2019 data
+                # (only the partitions of this indicator are read)
+                self._data[vname] = dataset.read(self.processed, var=vname)
+                self.fallback.add(vname)
+        return self._data[vname]
+
+    def year(self, vname):
+        # year plotted (2019 if the processed data had to be used)
+        self.indicator(vname)
+        return 2019 if vname in self.fallback else self.baseyear
+
+    def data(self):
+        # all indicators in one long frame, as stored in `processed`
+        return panel.concat(self.indicator(vname) for vname in sources.indicators)
+
+    @property
+    def labels(self):
+        if 'labels' not in self._dims:
+            self._dims['labels'] = es.get_dic('geo')
+        return self._dims['labels']
+
+    @property
+    def countries(self):
+        # country dimension of the Eurostat geo codes (see countries.py)
+        if 'countries' not in self._dims:
+            self._dims['countries'] = countries.dimension(self.labels)
+        return self._dims['countries']
+
+    def cube(self, *vnames):
+        # cube of the indicators used so far (and `vnames`), shared by the
+        # figures; made again only when an indicator is added or reloaded
+        current = self._cube.get('cube')
+        if current is None or any(v not in current.index['indicator'] for v in vnames):
+            used = [v for v in sources.indicators if v in self._data or v in vnames]
+            self._cube['cube'] = eurostat_cube(panel.concat(self.indicator(v) for v in used), self.countries)
+        return self._cube['cube']
+
+
+class Figures:
+    '''
+    Figure builders by figure name (see sources.figures), e.g. 'imgpop_2019',
+    'dd_2019_lfp' or 'dd_trend_lfp'. Figures are built on first access.
+    With `button_store=True`, the html of figures with country buttons ships
+    the button data as one shared table (see button_store.py). `precision`
+    rounds the data embedded in the html to that many decimals. With
+    `data_url` (the url of a data server, see data_server.py), the button data
+    is not embedded but fetched from <data_url><figure>/ on selection. With
+    `lazy_dir`, the html is a placeholder and the figure is written to
+    <lazy_dir><figure>.json, which the page fetches from <lazy_url><figure>.json
+    when the figure scrolls into view (see custom.js).
+    '''
+
+    # static image size (width, height) of the figures that are exported
+    export_size = {'imgpop': (1000, 600), 'dd': (1000, 600), 'abs': (1000, 1000)}
+
+    def __init__(self, undesa, eurostat, button_store=False, precision=None, data_url=None,
+            lazy_dir=None, lazy_url=None):
+        self.undesa = undesa
+        self.eurostat = eurostat
+        self.button_store = button_store
+        self.precision = precision
+        self.data_url = data_url
+        self.lazy_dir = lazy_dir
+        self.lazy_url = lazy_url
+        self.specs = sources.figures(eurostat.baseyear)
+        self.specs.update(sources.figures(undesa.baseyear))
+        self.labels = {vname: i.label for vname, i in sources.indicators.items()}
+        self._figures = {}
+
+    def names(self):
+        return list(self.specs)
+
+    def kind(self, name):
+        return self.specs[name][0]
+
+    def stem(self, name):
+        # file name of the figure, for the year of the data actually used
+        kind, vname = self.specs[name]
+        if vname is None:
+            return kind + '_' + str(self.undesa.year)
+        if kind == 'dd_trend':
+            return kind + '_' + vname
+        plotyear = sources.indicators[vname].year or self.eurostat.year(vname)
+        return kind + '_' + str(plotyear) + '_' + vname
+
+    def figure(self, name):
+        if name not in self._figures:
+            kind, vname = self.specs[name]
+            if vname is None:
+                fig = globals()['fig_' + kind](self.undesa.frame)
+            elif kind == 'dd_trend':
+                fig = fig_dd_trend(self.eurostat.cube(vname), vname, self.labels[vname],
+                    self.eurostat.year(vname))
+            else:
+                plotyear = sources.indicators[vname].year or self.eurostat.year(vname)
+                fig = globals()['fig_' + kind](self.eurostat.cube(vname), vname,
+                    self.labels[vname], plotyear)
+            self._figures[name] = fig
+        return self._figures[name]
+
+    def write_html(self, name, html_dir):
+        # write html without hard-coding dimensions, returns the files
+        file = html_dir + self.stem(name) + '.html'
+        fig = self.figure(name)
+        if self.data_url is not None and len(fig.layout.updatemenus) > 0:
+            button_store.compact(fig, remote=self.data_url + self.stem(name) + '/')
+        elif self.button_store and len(fig.layout.updatemenus) > 0:
+            button_store.compact(fig)
+        if self.lazy_dir is None:
+            return phtml_chunk(fig, file, self.precision)
+        return phtml_chunk(fig, file, self.precision, self.lazy_dir + self.stem(name) + '.json',
+            self.lazy_url + self.stem(name) + '.json')
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+'''
+
+Source locations and indicator definitions shared by the build driver
+(plot.py) and the data preparation (pipeline.py). Kept free of heavy imports.
+
+Please note that the links to the UNDESA data are hard-coded (they seem not to
+be API callable). The Eurostat links are the ones the `eurostat` package uses
+for bulk downloads, so that the download cache can be checked and warmed
+without going through the package.
+
+'''
+
+undesa_url = 'https://www.un.org/en/development/desa/population/migration/data/estimates2/data/'
+eurostat_url = 'https://ec.europa.eu/eurostat/estat-navtree-portlet-prod/BulkDownloadListing?'
+
+
+class Indicator:
+    '''
+    Eurostat indicator: `table` (bulk download code), rows used (`keep` and
+    `drop`: {dimension: codes}) and how the table maps onto the panel axes
+    (country, year, c_birth, sex): `rows` names the table dimension of each
+    axis given by the rows, the table columns are the remaining axis
+    (`columns`: 'year' or 'country'), `year` fixes the year of tables with
+    one column per country, `codes` renames table codes (e.g. of another
+    origin dimension) and `groups` are the origin groups compared with 'NAT'.
+    `trend`: the table has a time series (dd_trend figure).
+    '''
+
+    def __init__(self, name, label, table, keep=None, drop=None, rows=None, columns='year',
+            year=None, codes=None, groups=('FOR', 'EU28_FOR', 'NEU28_FOR'), trend=True):
+        self.name = name
+        self.label = label
+        self.table = table
+        self.keep = keep if keep is not None else {'age': ['Y15-64'],
+            'c_birth': ['NAT'] + list(groups), 'sex': ['F', 'M']}
+        self.drop = drop if drop is not None else {'geo\\time': ['EA19', 'EU15', 'EU27_2020']}
+        self.rows = rows if rows is not None else {'country': 'geo\\time', 'c_birth': 'c_birth', 'sex': 'sex'}
+        self.columns = columns
+        self.year = year
+        self.codes = codes or {}
+        self.groups = list(groups)
+        self.trend = trend
+
+
+# Eurostat indicators, in the order of the figures
+indicators = {i.name: i for i in [
+    Indicator('lfp', 'labor force participation', 'lfsa_argacob'),
+    Indicator('unemp', 'unemployment', 'lfsa_urgacob'),
+    Indicator('pt', 'part time employment', 'lfsa_eppgacob'),
+    Indicator('temp', 'temporary employment', 'lfsa_etpgacob'),
+    # one row per origin (mgstatus: native/foreign born) and sex, one column
+    # per country, 2014 only
+    Indicator('overq', 'overqualification', 'lfso_14loq',
+        keep={'age': ['Y15-64'], 'mgstatus': ['NBO', 'FBO'], 'isced11': ['TOTAL'], 'sex': ['F', 'M']},
+        drop={}, rows={'c_birth': 'mgstatus', 'sex': 'sex'}, columns='country', year=2014,
+        codes={'NBO': 'NAT', 'FBO': 'FOR'}, groups=['FOR'], trend=False),
+]}
+
+# Eurostat tables by indicator
+eurostat_tables = {name: i.table for name, i in indicators.items()}
+
+
+def undesa_urls(baseyear):
+    return {
+        'undesa_tot': undesa_url + 'UN_MigrantStockTotal_' + str(baseyear) + '.xlsx',
+        'undesa_od': undesa_url + 'UN_MigrantStockByOriginAndDestination_' + str(baseyear) + '.xlsx',
+    }
+
+
+def eurostat_urls():
+    urls = {vname: eurostat_url + 'sort=1&file=data%2F' + table + '.tsv.gz'
+        for vname, table in eurostat_tables.items()}
+    urls['geo'] = eurostat_url + 'file=dic%2Fen%2Fgeo.dic'
+    return urls
+
+
+def figures(baseyear):
+    # figure name (file stem for `baseyear`) -> (kind, indicator)
+    figs = {
+        'imgpop_' + str(baseyear): ('imgpop', None),
+        'imgpop_top5_' + str(baseyear): ('imgpop_top5', None),
+    }
+    for vname, indicator in indicators.items():
+        plotyear = indicator.year or baseyear
+        figs['dd_' + str(plotyear) + '_' + vname] = ('dd', vname)
+        figs['abs_' + str(plotyear) + '_' + vname] = ('abs', vname)
+        if indicator.trend:
+            figs['dd_trend_' + vname] = ('dd_trend', vname)
+    return figs
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+
+'''
+
+Migrant stocks of the UNDESA origin/destination workbook as one dense tensor
+
+    values[sex, destination, origin]    (float, NaN where not available)
+
+with index maps (label -> position) for each axis, instead of one wide frame
+per sex. Origins are the origin columns of the sheets, including 'Other
+North' and 'Other South'. Origin groups (e.g. EU, non-EU) are the product
+with an indicator matrix (origin x group), so any number of groupings costs
+one matrix product; the top k origins per destination come from a partial
+sort (argpartition), not from ranking the whole table.
+
+'''
+
+class Stocks:
+
+    def __init__(self, values, total, year, present, sexes, destinations, origins):
+        self.values = values # (sex, destination, origin)
+        self.total = total # (sex, destination)
+        self.year = year # (sex, destination)
+        self.present = present # (sex, destination): row in the sheet
+        self.sexes = list(sexes)
+        self.destinations = list(destinations)
+        self.origins = list(origins)
+        self.index = {
+            'sex': {s: i for i, s in enumerate(self.sexes)},
+            'destination': {d: i for i, d in enumerate(self.destinations)},
+            'origin': {o: i for i, o in enumerate(self.origins)},
+        }
+
+    @classmethod
+    def from_sheets(cls, sheets, destinations=None, ids=None):
+        '''
+        Tensor from the parsed sheets {sex: frame} of the workbook (columns
+        year, sort order, destination, ..., Total, origins), for the rows
+        whose sort order is in `ids` and destination in `destinations`
+        (default: all).
+        '''
+        frames = {}
+        for sex, df in sheets.items():
+            df = df.set_axis(np.append(['year', 'ID', 'country'], df.columns[3:]), axis=1)
+            df = df[[col for col in df.columns if 'Unnamed:' not in col]] # omit empty cols
+            if ids is not None:
+                df = df.loc[df['ID'].isin(ids)]
+            if destinations is not None:
+                df = df.loc[df['country'].isin(destinations)]
+            frames[sex] = df
+        first = next(iter(frames.values()))
+        origins = [col for col in first.columns if col not in ['year', 'ID', 'country', 'Total']]
+        dests = list(dict.fromkeys(d for df in frames.values() for d in df['country']))
+        shape = (len(frames), len(dests))
+        values = np.full(shape + (len(origins),), np.nan)
+        total = np.full(shape, np.nan)
+        year = np.zeros(shape, dtype=np.int64)
+        present = np.zeros(shape, dtype=bool)
+        for i, df in enumerate(frames.values()):
+            pos = [dests.index(d) for d in df['country']]
+            values[i, pos] = df.reindex(columns=origins).to_numpy(dtype=float)
+            total[i, pos] = df['Total'].to_numpy(dtype=float)
+            year[i, pos] = df['year'].to_numpy(dtype=np.int64)
+            present[i, pos] = True
+        return cls(values, total, year, present, list(frames), dests, origins)
+
+    def positions(self, axis, labels):
+        # positions of `labels` on `axis` (KeyError if one is unknown)
+        return np.array([self.index[axis][label] for label in labels], dtype=np.intp)
+
+    def aggregate(self, groups):
+        # sums by origin group {group: origins} (NaN counts as 0) -> (sex, destination, group)
+        indicator = np.zeros((len(self.origins), len(groups)))
+        for j, members in enumerate(groups.values()):
+            indicator[self.positions('origin', members), j] = 1
+        return np.nan_to_num(self.values) @ indicator
+
+    def top(self, k, exclude=()):
+        '''
+        The k largest origins per (sex, destination), without `exclude`:
+        positions (origin axis, -1 if there are fewer than k origins with
+        data) and values, largest first; ties in the order of the origins.
+        '''
+        candidates = np.setdiff1d(np.arange(len(self.origins)), self.positions('origin', exclude))
+        values = self.values[..., candidates].reshape(-1, len(candidates))
+        key = np.where(np.isnan(values), -np.inf, values)
+        k = min(k, len(candidates))
+        pos = np.full((len(key), k), -1, dtype=np.intp)
+        if k > 0:
+            # everything at least as large as the kth largest (ties included),
+            # then in order
+            kth = -np.partition(-key, k - 1, axis=1)[:, k - 1:k]
+            for row in range(len(key)):
+                cand = np.flatnonzero((key[row] >= kth[row]) & ~np.isnan(values[row]))
+                cand = cand[np.argsort(-key[row, cand], kind='stable')][:k]
+                pos[row, :len(cand)] = candidates[cand]
+        pos = pos.reshape(self.values.shape[:2] + (k,))
+        top = np.where(pos >= 0, np.take_along_axis(self.values, np.maximum(pos, 0), axis=2), np.nan)
+        return pos, top
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+
+'''
+
+Partition index shared by all figure builders. Instead of building a fresh
+boolean mask over the whole plotting frame for every trace (country x measure x
+reliability x origin), the frame is grouped once by the trace keys and stored
+sorted by group, so that every trace gets a contiguous slice:
+
+    idx = PartitionIndex(df_plot, ['country_label', 'measure_cat'])
+    idx.get('Austria', 'iwnw')        # rows of that group (original order)
+    idx.positions('Austria', 'iwnw')  # their row positions in df_plot
+    idx.mask('Austria', 'iwnw')       # boolean mask, e.g. for Series.where
+
+Keys that do not occur give an empty slice (same as an all-False mask). Pass
+`columns` to keep only the columns the traces need (selecting them per slice
+costs more than the slicing itself).
+
+'''
+
+class PartitionIndex:
+
+    def __init__(self, df, keys, columns=None):
+        self.keys = list(keys)
+        self.nrows = len(df)
+        groups = df.groupby(self.keys, sort=False, observed=True).indices
+        if len(groups) > 0:
+            order = np.concatenate(list(groups.values()))
+            sizes = np.array([len(v) for v in groups.values()])
+        else:
+            order = np.array([], dtype=np.intp)
+            sizes = np.array([], dtype=np.intp)
+        stops = np.cumsum(sizes)
+        self._bounds = {
+            (k if isinstance(k, tuple) else (k,)): (stop - size, stop)
+            for k, size, stop in zip(groups.keys(), sizes, stops)
+        }
+        self._order = order
+        self.frame = df.take(order) if columns is None else df[columns].take(order)
+
+    def __contains__(self, key):
+        return self._key(key) in self._bounds
+
+    def __len__(self):
+        return len(self._bounds)
+
+    def _key(self, key):
+        return key if isinstance(key, tuple) else (key,)
+
+    def _span(self, key):
+        return self._bounds.get(self._key(key), (0, 0))
+
+    def get(self, *key):
+        start, stop = self._span(key)
+        return self.frame.iloc[start:stop]
+
+    def positions(self, *key):
+        start, stop = self._span(key)
+        return self._order[start:stop]
+
+    def mask(self, *key):
+        m = np.zeros(self.nrows, dtype=bool)
+        m[self.positions(*key)] = True
+        return m
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+# the modules in src/ are imported as in src/plot.py; the synthetic data and
+# former implementations of the benchmarks are shared
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parents[1] / 'src'))
+sys.path.insert(0, str(Path(__file__).parents[1]))
+
+
+@pytest.fixture
+def gap_frame():
+    # wide frame of one indicator (see benchmarks/bench_gaps.py), with cells
+    # without data
+    from benchmarks import bench_gaps
+    df = bench_gaps.wide_frame('lfp', 30)
+    rng = np.random.default_rng(1)
+    for cb in bench_gaps.c_birth:
+        for sex in ['F', 'M']:
+            empty = rng.random(len(df)) < 0.1
+            df.loc[empty, ('lfp', 'avg', 'value', cb, sex)] = np.nan
+            df.loc[empty, ('lfp', 'avg', 'flag', cb, sex)] = np.nan
+    return df
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import build
+
+source = '''
+import re
+
+pattern = re.compile('[0-9]+')
+unused = 1
+
+def helper(text):
+    return pattern.sub('', text)
+
+def stage(text):
+    return helper(text)
+'''
+
+
+def code_hash(tmp_path, text, items):
+    (tmp_path / 'mod.py').write_text(text)
+    return build.Build(tmp_path / 'manifest.json', tmp_path).code_hash(items)
+
+
+def test_referenced_definitions(tmp_path):
+    # a function is hashed with the module-level definitions it uses
+    h = code_hash(tmp_path, source, ['mod.py:stage'])
+    assert code_hash(tmp_path, source.replace('[0-9]+', '[0-9]*'), ['mod.py:stage']) != h
+    assert code_hash(tmp_path, source.replace('unused = 1', 'unused = 2'), ['mod.py:stage']) == h
+
+
+def test_whole_file(tmp_path):
+    h = code_hash(tmp_path, source, ['mod.py'])
+    assert code_hash(tmp_path, source.replace('unused = 1', 'unused = 2'), ['mod.py']) != h
+
+
+def builder(tmp_path, fail):
+    # fetch -> a -> a2, fetch -> b -> b2; b raises if `fail`
+    b = build.Build(tmp_path / 'manifest.json', tmp_path, verbose=False)
+    def stage(name, fail=False):
+        def func():
+            if fail:
+                raise FileNotFoundError(name + '.xlsx')
+            return {'name': name}
+        return func
+    b.add('fetch', stage('fetch'))
+    b.add('a', stage('a'), deps=['fetch'], parallel=True)
+    b.add('b', stage('b', fail), deps=['fetch'], parallel=True)
+    b.add('a2', stage('a2'), deps=['a'], parallel=True)
+    b.add('b2', stage('b2'), deps=['b'], parallel=True)
+    return b
+
+
+def test_failed_stage(tmp_path):
+    # the stages not depending on it are run and recorded
+    for workers in [1, 2]:
+        b = builder(tmp_path / str(workers), True)
+        assert sorted(b.run(workers=workers)) == ['a', 'a2', 'fetch']
+        assert list(b.failed) == ['b'] and 'FileNotFoundError: b.xlsx' in b.failed['b']
+        assert b.skipped == {'b2': 'b'}
+        assert sorted(b.manifest) == ['a', 'a2', 'fetch']
+        # next time, only the failed stage and its dependants run
+        b = builder(tmp_path / str(workers), False)
+        assert sorted(b.run(workers=workers)) == ['b', 'b2']
+        assert b.failed == {} and b.skipped == {}
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import copy
+import json
+import plotly.graph_objects as go
+from plotly.utils import PlotlyJSONEncoder
+import button_store
+
+'''
+
+The shared button data table against the buttons it replaces: expanding a
+stored update (as Plotly_Button_Store in docs/dep/custom.js does) gives back
+the original restyle arguments.
+
+'''
+
+years = list(range(1995, 2020))
+
+
+def figure():
+    fig = go.Figure([go.Scatter(x=years, y=[0.0] * len(years)) for i in range(3)])
+    menus = []
+    for menu in range(2): # e.g. one menu per panel, with the same countries
+        buttons = [dict(label=country, method='restyle', args=[{
+            'x': [years] * 3,
+            'y': [[i + j * 0.5 + k for k in range(len(years))] for j in range(3)],
+            'text': [[country] * len(years)] * 3,
+            'name': ['a', 'b', 'c'],
+        }, [0, 1, 2]]) for i, country in enumerate(['Germany', 'France', 'UK'])]
+        buttons.append(dict(label='Compare to...', method='restyle', args=[{'visible': [True, False, True]}]))
+        menus.append(dict(buttons=buttons))
+    fig.update_layout(updatemenus=menus)
+    return fig
+
+
+def plain(value):
+    return json.loads(json.dumps(value, cls=PlotlyJSONEncoder))
+
+
+def expand(store, stored):
+    # custom.js: Plotly_Button_Store.restyle
+    def array(a):
+        return a if isinstance(a, list) else [a['fill']] * a['n']
+    return {attr: [array(store['pool'][k]) for k in v['pool']] if isinstance(v, dict) and 'pool' in v else v
+        for attr, v in stored.items()}
+
+
+def test_expand_equals_buttons():
+    fig = figure()
+    compact = button_store.compact(copy.deepcopy(fig))
+    store = compact.layout.meta['button_store']
+    for menu, original in zip(compact.layout.updatemenus, fig.layout.updatemenus):
+        for button, orig in zip(menu.buttons, original.buttons):
+            assert button.label == orig.label
+            if orig.label == 'Compare to...':
+                assert button.method == 'restyle' and plain(button.args) == plain(orig.args)
+                continue
+            assert button.method == 'skip'
+            update, traces = button.args
+            assert expand(store, store['updates'][update]) == plain(orig.args[0])
+            assert plain(traces) == [0, 1, 2]
+    # one update per country, shared by both menus; years and labels pooled once
+    assert len(store['updates']) == 3
+    assert {'fill': 'UK', 'n': len(years)} in store['pool']
+    assert sum(1 for a in store['pool'] if a == years) == 1
+
+
+def test_smaller():
+    fig = figure()
+    before = len(fig.to_json())
+    assert len(button_store.compact(fig).to_json()) < before
+
+
+def test_remote():
+    fig = button_store.compact(figure(), remote='http://127.0.0.1:8765/dd_trend_lfp/')
+    assert fig.layout.meta['button_store'] == {'remote': 'http://127.0.0.1:8765/dd_trend_lfp/'}
+    button = fig.layout.updatemenus[0].buttons[1]
+    assert button.method == 'skip' and plain(button.args) == ['France', [0, 1, 2]]
+    assert button_store.updates(figure())['France']['text'][0][0] == 'France'
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import pandas as pd
+import countries
+
+'''
+
+The country dimension against the former labelling of the Eurostat plot
+frame (apply and str.contains per row, group by lambda).
+
+'''
+
+countries_nwe = ['Austria', 'Belgium', 'Denmark', 'Finland', 'France',
+    'Germany', 'Iceland', 'Ireland', 'Luxembourg', 'Netherlands', 'Norway',
+    'Sweden', 'Switzerland', 'UK']
+countries_se = ['Greece', 'Malta', 'Italy', 'Portugal', 'Spain']
+countries_cee = ['Croatia', 'Czechia', 'Estonia', 'Hungary', 'Latvia',
+    'Lithuania', 'Montenegro', 'N. Macedonia', 'Poland', 'Romania',
+    'Serbia', 'Slovakia', 'Slovenia']
+
+geo = {'DE': 'Germany (until 1990 former territory of the FRG)', 'EU28': 'European Union - 28 countries (2013-2020)',
+    'MK': 'North Macedonia', 'UK': 'United Kingdom', 'FR': 'France', 'IT': 'Italy', 'PL': 'Poland',
+    'TR': 'Turkey', 'CH': 'Switzerland'}
+
+
+def former_labels(df, country_label):
+    df['country_label'] = df['country'].apply(lambda x: country_label[x])
+    df.loc[df['country_label'].str.contains('Germany'), 'country_label'] = 'Germany'
+    df.loc[df['country_label'].str.contains('European Union'), 'country_label'] = 'EU28'
+    df.loc[df['country_label'].str.contains('Macedonia'), 'country_label'] = 'N. Macedonia'
+    df.loc[df['country_label'].str.contains('United Kingdom'), 'country_label'] = 'UK'
+    c = pd.Categorical(df['country_label'],
+        categories=countries_nwe + countries_se + countries_cee, ordered=True)
+    df['country_label'] = c.astype('category')
+    df = df.dropna(subset=['country_label']) # restrict to defined regions
+    df['country_group'] = df['country_label'].apply(
+        lambda x: 'North-Western Europe' if x in countries_nwe
+        else ('Southern Europe' if x in countries_se else 'Central and Eastern Europe'))
+    c = pd.Categorical(df['country_group'],
+        categories=['North-Western Europe', 'Southern Europe', 'Central and Eastern Europe'],
+        ordered=True)
+    df['country_group'] = c.astype('category')
+    return df
+
+
+def test_labels_equal_former():
+    df = pd.DataFrame({'country': list(geo) * 3, 'value': range(3 * len(geo))})
+    former = former_labels(df.copy(), geo).reset_index(drop=True)
+    dim = countries.dimension(geo).rename(columns={'code': 'country', 'label': 'country_label',
+        'group': 'country_group'})
+    new = df.merge(dim[['country', 'country_label', 'country_group']], on='country', how='left')
+    new = new.dropna(subset=['country_label']).reset_index(drop=True)
+    pd.testing.assert_frame_equal(new, former[new.columns])
+    # EU28 and Turkey are not in any group
+    assert set(new['country']) == set(geo) - {'EU28', 'TR'}
+
+
+def test_order():
+    dim = countries.dimension(geo).set_index('code')
+    assert dim.loc['CH', 'order'] < dim.loc['IT', 'order'] < dim.loc['MK', 'order']
+    assert dim.loc['TR', 'order'] == -1
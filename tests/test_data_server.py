@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import json
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+import plotly.graph_objects as go
+import pytest
+import button_store
+import data_server
+
+
+def figure():
+    # two traces, restyled by a button per country (as dd_trend_*)
+    fig = go.Figure([go.Scatter(x=[2018, 2019], y=[1.0, 2.0]), go.Scatter(x=[2018, 2019], y=[3.0, 4.0])])
+    buttons = [dict(label=country, method='restyle',
+        args=[{'y': [[i + 0.123456, i + 1.0], [i + 2.0, i + 3.0]], 'text': [[country] * 2, [country] * 2]}, [0, 1]])
+        for i, country in enumerate(['Germany', 'United Kingdom'])]
+    fig.update_layout(updatemenus=[dict(buttons=buttons)])
+    return fig
+
+
+@pytest.fixture
+def url():
+    data = data_server.FigureData({'dd_trend_lfp': figure}, precision=3)
+    httpd = data_server.server(data, port=0)
+    threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True).start()
+    yield 'http://127.0.0.1:' + str(httpd.server_port) + '/'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(url, headers={}):
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=10) as resp:
+            return resp.status, resp.headers, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers, e.read()
+
+
+def test_updates(url):
+    assert json.loads(get(url)[2]) == ['dd_trend_lfp']
+    updates = button_store.updates(figure())
+    assert json.loads(get(url + 'dd_trend_lfp/')[2]) == list(updates)
+    for label, update in updates.items():
+        status, headers, body = get(url + 'dd_trend_lfp/' + urllib.parse.quote(label) + '.json')
+        assert status == 200
+        assert headers['Access-Control-Allow-Origin'] == '*'
+        assert json.loads(body) == button_store.round_floats(update, 3)
+    assert json.loads(body)['y'][0] == [1.123, 2.0]
+
+
+def test_not_modified(url):
+    status, headers, body = get(url + 'dd_trend_lfp/Germany.json')
+    status, _, body = get(url + 'dd_trend_lfp/Germany.json', {'If-None-Match': headers['ETag']})
+    assert status == 304 and body == b''
+    assert get(url + 'dd_trend_lfp/Germany.json', {'If-None-Match': '"other"'})[0] == 200
+
+
+@pytest.mark.parametrize('path', ['other/', 'dd_trend_lfp/France.json', 'dd_trend_lfp/Germany',
+    'dd_trend_lfp/Germany.json/x'])
+def test_not_found(url, path):
+    assert get(url + path)[0] == 404
+
+
+def test_slow_figure():
+    # a figure being built does not hold up requests for other figures
+    release = threading.Event()
+    def slow():
+        release.wait(10)
+        return figure()
+    data = data_server.FigureData({'slow': slow, 'fast': figure})
+    pending = threading.Thread(target=data.get, args=('/slow/Germany.json',))
+    pending.start()
+    try:
+        done = threading.Thread(target=data.get, args=('/fast/Germany.json',))
+        done.start()
+        done.join(5)
+        assert not done.is_alive()
+        assert pending.is_alive()
+    finally:
+        release.set()
+        pending.join()
+    assert data.stats == {'hit': 0, 'miss': 2}
+    data.get('/slow/Germany.json')
+    assert data.stats['hit'] == 1
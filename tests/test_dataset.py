@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import multiprocessing
+import pandas as pd
+import pytest
+import dataset
+
+
+def write_year(root, year):
+    df = pd.DataFrame({'year': [str(year)] * 3, 'value': [1.0, 2.0, float(year)]})
+    dataset.write(df, root, ['year'], partitions=True)
+
+
+def test_partitions_kept(tmp_path):
+    root = tmp_path / 'undesa'
+    write_year(root, 2018)
+    write_year(root, 2019)
+    write_year(root, 2019)
+    df = dataset.read(root)
+    assert sorted(df['year'].unique()) == ['2018', '2019']
+    assert len(df) == 6
+
+
+def test_other_partitioning(tmp_path):
+    root = tmp_path / 'undesa'
+    write_year(root, 2019)
+    with pytest.raises(ValueError):
+        dataset.write(pd.DataFrame({'var': ['lfp'], 'value': [1.0]}), root, ['var'], partitions=True)
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason='needs fork')
+def test_concurrent_writers(tmp_path):
+    # the recodes of several UNDESA years write the same dataset in parallel
+    root = tmp_path / 'processed' / 'undesa'
+    ctx = multiprocessing.get_context('fork')
+    years = list(range(2014, 2020))
+    procs = [ctx.Process(target=write_year, args=(root, year)) for year in years]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+    assert [p.exitcode for p in procs] == [0] * len(years)
+    assert sorted(dataset.read(root)['year'].unique()) == [str(y) for y in years]
+    # no tmp directories left
+    assert sorted(f.name for f in root.parent.iterdir()) == ['undesa', 'undesa.lock']
+
+
+def test_lock_timeout(tmp_path, monkeypatch):
+    # msvcrt (Windows): a lock that is never released raises after LOCK_TIMEOUT
+    class msvcrt:
+        LK_LOCK, LK_UNLCK = 1, 0
+
+        @staticmethod
+        def locking(fd, mode, nbytes):
+            raise OSError('locked')
+    monkeypatch.setattr(dataset, 'fcntl', None)
+    monkeypatch.setattr(dataset, 'msvcrt', msvcrt, raising=False)
+    monkeypatch.setattr(dataset, 'LOCK_TIMEOUT', 0.1)
+    with pytest.raises(TimeoutError):
+        write_year(tmp_path / 'undesa', 2019)
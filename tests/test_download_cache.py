@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import download_cache
+
+
+class Handler(BaseHTTPRequestHandler):
+    # files by path: body, validator ('etag', 'last_modified' or None)
+    files = {}
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get('If-None-Match'), self.headers.get('If-Modified-Since')))
+        if self.path not in self.files:
+            self.send_response(404)
+            self.end_headers()
+            return
+        body, validator = self.files[self.path]
+        etag = '"' + str(hash(body)) + '"'
+        modified = 'Wed, 01 Jan 2020 00:00:00 GMT' if body == b'old' else 'Thu, 01 Jan 2021 00:00:00 GMT'
+        if (validator == 'etag' and self.headers.get('If-None-Match') == etag
+                or validator == 'last_modified' and self.headers.get('If-Modified-Since') == modified):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        if validator == 'etag':
+            self.send_header('ETag', etag)
+        if validator == 'last_modified':
+            self.send_header('Last-Modified', modified)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    # local stand-in for the data sources
+    handler = type('Handler', (Handler,), {'files': {}, 'requests': []})
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    httpd.url = 'http://127.0.0.1:' + str(httpd.server_port)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_ttl_hit(server, tmp_path):
+    server.RequestHandlerClass.files['/a'] = (b'data', 'etag')
+    cache = download_cache.DownloadCache(tmp_path, ttl=3600)
+    assert cache.read(server.url + '/a') == b'data'
+    # within the ttl: no request at all, also for a new cache on the same root
+    assert cache.read(server.url + '/a') == b'data'
+    assert download_cache.DownloadCache(tmp_path, ttl=3600).read(server.url + '/a') == b'data'
+    assert len(server.RequestHandlerClass.requests) == 1
+    assert cache.stats['download'] == 1 and cache.stats['hit'] == 1
+
+
+@pytest.mark.parametrize('validator', ['etag', 'last_modified'])
+def test_revalidate(server, tmp_path, validator):
+    files = server.RequestHandlerClass.files
+    files['/a'] = (b'old', validator)
+    cache = download_cache.DownloadCache(tmp_path, ttl=0)
+    cache.read(server.url + '/a')
+    # unchanged: 304 with the validator of the first response
+    assert cache.read(server.url + '/a') == b'old'
+    path, etag, modified = server.RequestHandlerClass.requests[-1]
+    assert (etag if validator == 'etag' else modified) is not None
+    assert cache.stats['revalidated'] == 1
+    # changed: downloaded again
+    files['/a'] = (b'new', validator)
+    assert cache.read(server.url + '/a') == b'new'
+    assert cache.stats['download'] == 2
+
+
+def test_offline(server, tmp_path):
+    server.RequestHandlerClass.files['/a'] = (b'data', 'etag')
+    download_cache.DownloadCache(tmp_path).read(server.url + '/a')
+    n = len(server.RequestHandlerClass.requests)
+    cache = download_cache.DownloadCache(tmp_path, ttl=0, offline=True)
+    assert cache.read(server.url + '/a') == b'data'
+    assert len(server.RequestHandlerClass.requests) == n
+    with pytest.raises(download_cache.CacheMiss):
+        cache.read(server.url + '/b')
+
+
+def test_unreachable(server, tmp_path):
+    # expired, but the server is gone: the cached copy is used
+    server.RequestHandlerClass.files['/a'] = (b'data', 'etag')
+    url = server.url + '/a'
+    download_cache.DownloadCache(tmp_path).read(url)
+    server.shutdown()
+    server.server_close()
+    cache = download_cache.DownloadCache(tmp_path, ttl=0, timeout=5)
+    assert cache.read(url) == b'data'
+    assert cache.stats['stale'] == 1
+
+
+def test_lru_eviction(server, tmp_path):
+    for name in 'abc':
+        server.RequestHandlerClass.files['/' + name] = (name.encode() * 10, 'etag')
+    cache = download_cache.DownloadCache(tmp_path, max_bytes=25)
+    cache.read(server.url + '/a')
+    cache.read(server.url + '/b')
+    cache.read(server.url + '/a') # b is least recently used
+    cache.read(server.url + '/c')
+    assert sorted(cache.index) == [server.url + '/a', server.url + '/c']
+    assert cache.size() == 20
+    assert len(list((tmp_path / 'objects').glob('*/*'))) == 2
+
+
+def test_eviction_shared_blob(server, tmp_path):
+    # a blob is counted and deleted once, with the last entry using it
+    for name, body in [('a', b'x' * 10), ('b', b'x' * 10), ('c', b'y' * 10)]:
+        server.RequestHandlerClass.files['/' + name] = (body, 'etag')
+    cache = download_cache.DownloadCache(tmp_path)
+    for name in 'abc':
+        cache.read(server.url + '/' + name)
+    cache.evict(10)
+    assert sorted(cache.index) == [server.url + '/c']
+    assert len(list((tmp_path / 'objects').glob('*/*'))) == 1
+    cache.evict(0)
+    assert cache.index == {} and cache.size() == 0
+
+
+def test_hits_batched(server, tmp_path):
+    server.RequestHandlerClass.files['/a'] = (b'data', 'etag')
+    url = server.url + '/a'
+    cache = download_cache.DownloadCache(tmp_path)
+    cache.read(url)
+    written = (tmp_path / 'index.json').read_text()
+    cache.read(url)
+    # a hit does not rewrite the index, flush() does
+    assert (tmp_path / 'index.json').read_text() == written
+    cache.flush()
+    accessed = download_cache.DownloadCache(tmp_path).index[url]['accessed']
+    assert accessed == cache.index[url]['accessed']
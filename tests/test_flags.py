@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import flags
+from benchmarks import bench_gaps
+
+'''
+
+Flag bitmasks against the former flag strings: gap flags of the loop over the
+wide frame (see benchmarks/bench_gaps.py), the reliability column, decoding.
+
+'''
+
+def test_gaps_equal_loop(gap_frame):
+    # OR of the bitmasks = bitmask of the concatenated strings; no data
+    # (NaN string) propagates as MISSING
+    df = gap_frame
+    loop = bench_gaps.gaps_loop(df.copy(), 'lfp')
+    engine = bench_gaps.gaps_frame(flags.encode_frame(df), 'lfp')
+    cols = [c for c in loop.columns if c[2] == 'flag' and c[1] != 'avg']
+    strings = loop[cols].to_numpy().ravel()
+    masks = engine[cols].to_numpy().ravel()
+    missing = pd.isna(strings)
+    assert missing.any()
+    assert (flags.missing(masks) == missing).all()
+    assert (flags.encode(strings[~missing]) == masks[~missing]).all()
+
+
+def test_reliability_equal_apply():
+    strings = pd.Series(['', 'u', 'b', 'bu', 'ub', ':', 'p'])
+    former = strings.apply(lambda x: 'Low' if 'u' in x else 'Ok')
+    assert (np.where(flags.has(flags.encode(strings), 'u'), 'Low', 'Ok') == former).all()
+
+
+def test_decode():
+    strings = np.array(['', 'u', 'bu', np.nan], dtype=object)
+    decoded = flags.decode(flags.encode(strings))
+    assert list(decoded[:3]) == ['', 'u', 'bu'] and pd.isna(decoded[3])
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import flags
+import gaps
+from benchmarks import bench_gaps
+
+'''
+
+The gap engine against the former loop over the wide frame (see
+benchmarks/bench_gaps.py).
+
+'''
+
+def test_values_equal_loop(gap_frame):
+    df = gap_frame
+    loop = bench_gaps.gaps_loop(df.copy(), 'lfp')
+    engine = bench_gaps.gaps_frame(flags.encode_frame(df), 'lfp')
+    assert sorted(engine.columns) == sorted(loop.columns)
+    values = engine.columns[engine.columns.get_level_values('info') == 'value']
+    pd.testing.assert_frame_equal(engine[values], loop[values].astype(float))
+
+
+def test_new_contrast():
+    # a contrast is one entry, IMM standing for every group
+    values = np.arange(8, dtype=float).reshape(1, 4, 2) # (row, c_birth, sex)
+    contrasts = dict(gaps.contrasts, imnm=((gaps.IMM, 'M'), ('NAT', 'M')))
+    gap = gaps.gaps(values, bench_gaps.c_birth, ['F', 'M'], bench_gaps.cblist, contrasts)
+    # imnm of FOR: FOR/M - NAT/M
+    assert gap[0, 3, 0, 0] == values[0, 1, 1] - values[0, 0, 1]
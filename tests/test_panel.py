@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import numpy as np
+import pandas as pd
+import flags
+import panel
+import pipeline
+from benchmarks import bench_panel
+
+'''
+
+The long panel of the recode against the former wide recode (stack/unstack,
+cells without data padded with NaN), and the memory both take. Tables are the
+synthetic ones of benchmarks/bench_panel.py.
+
+'''
+
+def former_recode(df, vname):
+    # the recode loop of the baseline src/plot.py for one of the four tables of
+    # the same structure (overq left out), verbatim except for the c_birth
+    # selection: `isin(3)` always raised
+    dfs = {}
+
+    # create dict entry with selection
+    dfs[vname] = df[
+        (df['age']=='Y15-64') &
+        (df['c_birth'].isin(['NAT', 'FOR', 'EU28_FOR', 'NEU28_FOR'])) &
+        (df['geo\\time'].isin(['EA19', 'EU15', 'EU27_2020']) == False) &
+        (df['sex'].isin(['F', 'M']))
+    ]
+    # drop, rename
+    dfs[vname] = dfs[vname].drop(columns=['unit','age'])
+    dfs[vname] = dfs[vname].rename(columns={'geo\\time': 'country'})
+
+    # order
+    col_order = ['country', 'c_birth', 'sex']
+    cols_ordered = col_order + (dfs[vname].columns.drop(col_order).tolist())
+    dfs[vname] = dfs[vname][cols_ordered]
+
+    # row index
+    dfs[vname] = dfs[vname].sort_values(by=['country','c_birth','sex'], axis=0)
+    c = dfs[vname].country
+    cb = dfs[vname].c_birth
+    s = dfs[vname].sex
+    dfs[vname].index = [c,cb,s]
+    dfs[vname] = dfs[vname].drop(columns=['sex','c_birth','country'])
+
+    # column index
+    cols = list(dfs[vname].columns)
+    colnames1 = []
+    colnames2 = []
+    colnames3 = []
+    colnames4 = []
+    for c in cols:
+        colnames1 = np.append(colnames1, [vname]) # indicator
+        colnames2 = np.append(colnames2, [c[:4] if vname!='overq' else '2014']) # extract year
+        colnames3 = np.append(colnames3, ['avg']) # measurement (add gaps later)
+        colnames4 = np.append(colnames4, [c[5:] if vname!='overq' else c]) # extract info
+    dfs[vname].columns = [colnames1, colnames2, colnames3, colnames4]
+    dfs[vname].columns.names = ['var', 'year', 'measure', 'info']
+
+    # stack/unstack
+    dfs[vname] = dfs[vname].unstack('c_birth')
+    dfs[vname] = dfs[vname].unstack('sex')
+    dfs[vname] = dfs[vname].stack('year')
+
+    # calculate gaps and add as constant per gender, add flags
+    if (vname != 'overq'):
+        cblist = ['FOR', 'EU28_FOR', 'NEU28_FOR']
+    else:
+        cblist = ['FOR']
+    for cb in cblist:
+        for g in ['F', 'M']:
+            # immigrant women vs. native men
+            dfs[vname][vname, 'iwnw', 'value', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - dfs[vname].loc[:, (vname, 'avg', 'value', 'NAT', 'F')]
+                )
+            dfs[vname][vname, 'iwnw', 'flag', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + dfs[vname].loc[:, (vname, 'avg', 'flag', 'NAT', 'F')]
+                )
+            # immigrant women vs. immigrant men
+            dfs[vname][vname, 'iwim', 'value', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - dfs[vname].loc[:, (vname, 'avg', 'value', cb, 'M')]
+                )
+            dfs[vname][vname, 'iwim', 'flag', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + dfs[vname].loc[:, (vname, 'avg', 'flag', cb, 'M')]
+                )
+            # immigrant women vs. native men
+            dfs[vname][vname, 'iwnm', 'value', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'value', cb, 'F')]
+                - dfs[vname].loc[:, (vname, 'avg', 'value', 'NAT', 'M')]
+                )
+            dfs[vname][vname, 'iwnm', 'flag', cb, g] = (
+                dfs[vname].loc[:, (vname, 'avg', 'flag', cb, 'F')]
+                + dfs[vname].loc[:, (vname, 'avg', 'flag', 'NAT', 'M')]
+                )
+
+    # stack/unstack
+    dfs[vname] = dfs[vname].stack('c_birth')
+    dfs[vname] = dfs[vname].stack('sex')
+
+    return dfs[vname]
+
+
+def plain(df):
+    # cells as strings and numbers, in key order
+    df = df[panel.keys + ['value', 'flag']].copy()
+    df.columns.name = None
+    for key in panel.keys:
+        df[key] = df[key].astype(str)
+    return df.sort_values(panel.keys).reset_index(drop=True)
+
+
+def recoded(nvars, nyears):
+    # long panel of `nvars` indicators v0, v1, ... (recoded as lfp)
+    frames = []
+    for i in range(nvars):
+        df = pipeline.recode_indicator(bench_panel.raw_table(36, nyears, seed=i), 'lfp')
+        df['var'] = df['var'].cat.rename_categories(['v' + str(i)])
+        frames.append(df)
+    return panel.concat(frames)
+
+
+def test_recode_equals_former():
+    raw = bench_panel.raw_table(36, 25)
+    wide = former_recode(raw, 'lfp')
+    long = pipeline.recode_indicator(raw, 'lfp')
+    pd.testing.assert_frame_equal(plain(long), plain(panel.from_wide(wide)))
+    # every cell with data once, no padding
+    assert not flags.missing(long['flag']).any()
+    assert len(long) == len(long.drop_duplicates(panel.keys))
+
+
+def test_memory():
+    # the long frame of five indicators takes a fraction of the former wide
+    # one (NaN padded by the outer joins of the indicators, flag strings)
+    long = recoded(5, 25)
+    wide = bench_panel.wide_frame(long)
+    assert long.memory_usage(deep=True).sum() * 4 < wide.memory_usage(deep=True).sum()
+
+
+def test_concat_select():
+    lfp = pipeline.recode_indicator(bench_panel.raw_table(36, 25), 'lfp')
+    unemp = pipeline.recode_indicator(bench_panel.raw_table(36, 25, seed=1), 'unemp')
+    df = panel.concat([lfp, unemp])
+    assert list(df['var'].cat.categories) == ['lfp', 'unemp']
+    pd.testing.assert_frame_equal(plain(panel.select(df, 'unemp')), plain(unemp))
+    assert df['value'].dtype == np.float64 and df['flag'].dtype == flags.dtype
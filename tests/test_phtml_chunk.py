@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import json
+import re
+import plotly.graph_objects as go
+import pipeline
+
+
+def figure():
+    return go.Figure(go.Scatter(x=[1995, 1996], y=[72.345678, 1.5e-07], text=['Share 12.345678 of', 'x'],
+        hovertemplate='%{y:.2f} of 0.123456'), layout={'title': 'Rate 3.14159 (2019)'})
+
+
+def former_chunk(figobj, figfile):
+    # write, read back and post-process with four regexes (before the single
+    # in-memory pass)
+    figobj.update_layout(paper_bgcolor = 'rgba(255,255,255,0)')
+    figobj.write_html(figfile, default_height='100%', default_width='100%', full_html=False,
+        include_plotlyjs=False)
+    with open(figfile,'r') as file:
+        filedata = file.read()
+        filedata = re.sub(r'<div>\s*', '<div class="figure_wrap_plotly">', filedata)
+        filedata = re.sub(r'\s*\s</div>', '</div>', filedata)
+        filedata = re.sub(r'\s*<script', '<script', filedata)
+        filedata = re.sub(r'\s*</script>', '</script>', filedata)
+    return filedata
+
+
+def without_ids(text):
+    # div ids are random
+    return re.sub(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', 'id', text)
+
+
+def embedded(file):
+    text = open(file).read()
+    m = re.search(r'Plotly\.newPlot\(\s*"[^"]+",\s*(\[.*?\]),\s*(\{.*\}),\s*\{"responsive', text, re.S)
+    return json.loads(m.group(1)), json.loads(m.group(2))
+
+
+def test_rounds_numbers_only(tmp_path):
+    files = pipeline.phtml_chunk(figure(), str(tmp_path / 'fig.html'), 2)
+    assert files == [str(tmp_path / 'fig.html')]
+    data, layout = embedded(files[0])
+    assert data[0]['y'] == [72.35, 0.0]
+    assert data[0]['x'] == [1995, 1996]
+    assert data[0]['text'] == ['Share 12.345678 of', 'x']
+    assert data[0]['hovertemplate'] == '%{y:.2f} of 0.123456'
+    assert layout['title']['text'] == 'Rate 3.14159 (2019)'
+
+
+def test_equals_former(tmp_path):
+    # without rounding, the chunk is the one written before
+    file = pipeline.phtml_chunk(figure(), str(tmp_path / 'fig.html'))[0]
+    with open(file) as f:
+        chunk = f.read()
+    assert without_ids(chunk) == without_ids(former_chunk(figure(), str(tmp_path / 'former.html')))
+    assert chunk.startswith('<div class="figure_wrap_plotly">')
+
+
+def test_full_precision(tmp_path):
+    data, _ = embedded(pipeline.phtml_chunk(figure(), str(tmp_path / 'fig.html'))[0])
+    assert data[0]['y'] == [72.345678, 1.5e-07]
+
+
+def test_lazy(tmp_path):
+    # placeholder and data file with the figure as embedded otherwise
+    html, data_file = pipeline.phtml_chunk(figure(), str(tmp_path / 'fig.html'), 2,
+        str(tmp_path / 'fig.json'), 'data/fig.json')
+    chunk = open(html).read()
+    assert 'plotly-lazy' in chunk and 'data-src="data/fig.json"' in chunk and 'newPlot' not in chunk
+    with open(data_file) as file:
+        spec = json.load(file)
+    assert (spec['data'], spec['layout']) == embedded(pipeline.phtml_chunk(figure(), str(tmp_path / 'e.html'), 2)[0])
+    assert spec['config'] == {'responsive': True}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+# imports
+import urllib.error
+import pytest
+import panel
+import pipeline
+from download_cache import CacheMiss
+from benchmarks import bench_panel
+
+'''
+
+Fallback of EurostatPanel to the processed data: only for tables that cannot
+be fetched.
+
+'''
+
+@pytest.fixture
+def processed(tmp_path):
+    df = pipeline.recode_indicator(bench_panel.raw_table(36, 25), 'lfp')
+    pipeline.write_eurostat(df, tmp_path / 'eurostat')
+    return str(tmp_path / 'eurostat')
+
+
+@pytest.mark.parametrize('error', [CacheMiss('offline'), urllib.error.URLError('down'), EOFError()])
+def test_unavailable(processed, monkeypatch, error):
+    def read_indicator(vname):
+        raise error
+    monkeypatch.setattr(pipeline, 'read_indicator', read_indicator)
+    eurostat = pipeline.EurostatPanel(2020, processed)
+    assert len(panel.select(eurostat.indicator('lfp'), 'lfp')) > 0
+    assert eurostat.year('lfp') == 2019
+
+
+def test_recode_error_raised(processed, monkeypatch):
+    # e.g. a changed layout of the table is not hidden by the fallback
+    monkeypatch.setattr(pipeline, 'read_indicator', lambda vname: bench_panel.raw_table(36, 25).drop(columns='sex'))
+    with pytest.raises(KeyError):
+        pipeline.EurostatPanel(2020, processed).indicator('lfp')